@@ -3,13 +3,33 @@
 AgriClimate Intelligent Q&A System Core Logic
 Converts natural language to SQL and generates human-like answers
 """
+import asyncio
+import io
 import duckdb
 import re
 import os
+import hashlib
 import logging
+import threading
+from collections import OrderedDict
+from functools import lru_cache
+import pyarrow as pa
+import pyarrow.csv as pa_csv
+import sqlglot
+from sqlglot import exp
+from sqlglot.optimizer.scope import traverse_scope
+
+try:
+    # google-re2: DFA matching, linear time regardless of input
+    import re2 as dfa_re
+except ImportError:
+    dfa_re = re
 from dotenv import load_dotenv
-from groq import Groq
-from schema import SCHEMA
+from groq import NOT_GIVEN
+from schema import SCHEMA, SCHEMA_LINES
+from database_connection import get_connection, run_in_db_pool
+from llm_cache import LLMCache
+from groq_client import async_client as client
 
 # Setup logging
 logging.basicConfig(level=logging.INFO)
@@ -19,31 +39,60 @@ logger = logging.getLogger(__name__)
 load_dotenv()
 
 # === CONFIG ===
-# Use DB_PATH from environment if available, else fallback to local path
-DB_PATH = os.getenv("DB_PATH", "/Users/manusd/Crop/data/processed/agri_climate_db.duckdb")
-MODEL = "llama-3.3-70b-versatile"
-GROQ_API_KEY = os.getenv("GROQ_API_KEY")
+# SQL generation needs the big model's accuracy; a 2-4 sentence summary does not
+SQL_MODEL = "llama-3.3-70b-versatile"
+ANSWER_MODEL = "llama-3.1-8b-instant"
+# Optional Groq service tier (e.g. "performance" for lowest TTFT); unset → account default
+SERVICE_TIER = os.getenv("GROQ_SERVICE_TIER")
+
+# Groq: the shared pooled async client, so round-trips never block the event loop
+
+# === RESPONSE CACHE ===
+# Repeated questions skip the Groq round-trips. The schema fingerprint is part
+# of every key so editing SCHEMA invalidates previously generated SQL.
+CACHE_MAX_ENTRIES = 1024
+CACHE_TTL_SECONDS = 3600
+SCHEMA_FINGERPRINT = hashlib.md5(repr(SCHEMA).encode()).hexdigest()
+
+_sql_cache = LLMCache(max_entries=CACHE_MAX_ENTRIES)
+_answer_cache = LLMCache(max_entries=CACHE_MAX_ENTRIES)
+
+def _cache_key(*parts: str) -> str:
+    """Stable short digest over the given key parts"""
+    return hashlib.blake2b("\x1f".join(parts).encode(), digest_size=16).hexdigest()
+
+# ASCII A-Z → a-z; bytes.translate lowercases in C without building str copies
+_LOWER_TBL = bytes.maketrans(bytes(range(65, 91)), bytes(range(97, 123)))
+_QUESTION_KEY_SUFFIX = f"\x1f{SCHEMA_FINGERPRINT}\x1f{SQL_MODEL}".encode()
 
-if not GROQ_API_KEY:
-    raise ValueError("GROQ_API_KEY not found in environment. Please set it in Render or .env file.")
+def _normalize_question(question: str) -> bytes:
+    """Lowercased question with whitespace runs collapsed"""
+    return b" ".join(question.encode().translate(_LOWER_TBL).split())
 
-# === INIT GROQ ===
-client = Groq(api_key=GROQ_API_KEY)
+def _question_key(question: str) -> str:
+    """Cache key for a question under the current schema and model"""
+    return hashlib.blake2b(
+        _normalize_question(question) + _QUESTION_KEY_SUFFIX, digest_size=16
+    ).hexdigest()
 
 # === HELPER: Clean SQL ===
+# Compiled once at import; clean_sql runs on every generated query
+_MD_SQL = re.compile(r'^```sql\s*', re.IGNORECASE)
+_MD_ANY = re.compile(r'^```\s*|```$')
+_SELECT_TAIL = re.compile(r'(SELECT\s+.*?;?)\s*$', re.IGNORECASE | re.DOTALL)
+
 def clean_sql(query: str) -> str:
     """Extract and clean SQL query from LLM response"""
     query = query.strip()
     
     # Remove markdown code blocks
-    query = re.sub(r'^```sql\s*', '', query, flags=re.IGNORECASE)
-    query = re.sub(r'^```\s*', '', query)
-    query = re.sub(r'```$', '', query)
+    query = _MD_SQL.sub('', query)
+    query = _MD_ANY.sub('', query)
     query = query.strip()
     
     # Extract SELECT statement if embedded in text
     if not query.upper().startswith('SELECT'):
-        match = re.search(r'(SELECT\s+.*?;?)\s*$', query, re.IGNORECASE | re.DOTALL)
+        match = _SELECT_TAIL.search(query)
         if match:
             query = match.group(1)
     
@@ -51,12 +100,108 @@ def clean_sql(query: str) -> str:
     query = query.rstrip(';').strip()
     return query
 
+# === HELPER: Harden SQL ===
+MAX_ROWS = 100
+# Large tables must be filtered on their sort-key columns so DuckDB can skip row groups
+PRUNING_COLUMNS = {
+    "crop_production_raw": {"state", "crop_year"},
+}
+
+def _having_to_where(select: exp.Select) -> None:
+    """Move HAVING conjuncts that only test GROUP BY columns into WHERE (pushed down before aggregation)"""
+    having = select.args.get("having")
+    group = select.args.get("group")
+    if not having or not group:
+        return
+    group_cols = {c.name.lower() for c in group.expressions if isinstance(c, exp.Column)}
+    keep = []
+    for cond in having.this.flatten() if isinstance(having.this, exp.And) else [having.this]:
+        cols = {c.name.lower() for c in cond.find_all(exp.Column)}
+        if cols and cols <= group_cols and not cond.find(exp.AggFunc):
+            select.where(cond.copy(), copy=False)
+        else:
+            keep.append(cond)
+    if keep:
+        select.set("having", exp.Having(this=exp.and_(*keep)))
+    else:
+        select.set("having", None)
+
+def harden_sql(sql: str) -> str:
+    """Clamp LIMIT, push row filters out of HAVING and refuse unfiltered scans of large tables"""
+    try:
+        tree = sqlglot.parse_one(sql, dialect="duckdb")
+    except sqlglot.errors.ParseError as e:
+        raise ValueError(f"Could not parse generated SQL: {e}")
+    if not isinstance(tree, exp.Query):
+        raise ValueError(f"Only SELECT queries are allowed: {sql}")
+
+    for scope in traverse_scope(tree):
+        if not isinstance(scope.expression, exp.Select):
+            continue
+        _having_to_where(scope.expression)
+        where = scope.expression.args.get("where")
+        filtered = {c.name.lower() for c in where.find_all(exp.Column)} if where else set()
+        for source in scope.sources.values():
+            required = isinstance(source, exp.Table) and PRUNING_COLUMNS.get(source.name.lower())
+            if required and not filtered & required:
+                raise ValueError(
+                    f"Query scans {source.name} without filtering on {' or '.join(sorted(required))}"
+                )
+
+    limit = tree.args.get("limit")
+    value = limit.expression if limit else None
+    if not (isinstance(value, exp.Literal) and value.is_int and int(value.this) <= MAX_ROWS):
+        tree = tree.limit(MAX_ROWS, copy=False)
+    return tree.sql(dialect="duckdb")
+
+# === HELPER: Complexity detection ===
+_COMPLEX_RE = dfa_re.compile(
+    r'compare.*with|comparison|difference between|highest.*lowest|maximum.*minimum|max.*min'
+    r'|both.*and|versus|\bvs\b|calculate.*difference|percent difference'
+    r'|latest year.*compare|which.*highest.*which.*lowest'
+)
+
+def is_complex_query(question: str) -> bool:
+    """Comparisons and multi-part questions need the larger answer model"""
+    return bool(_COMPLEX_RE.search(question.lower()))
+
+# === HELPER: Stream SQL ===
+async def stream_sql(stream) -> str:
+    """Collect a streamed completion, stopping at the first ';' that ends the SQL"""
+    parts = []
+    try:
+        async for chunk in stream:
+            if not chunk.choices:
+                continue
+            delta = chunk.choices[0].delta.content or ""
+            if ";" in delta:
+                parts.append(delta[:delta.index(";") + 1])
+                break
+            parts.append(delta)
+    finally:
+        # Dropping the rest of the generation frees the connection early
+        await stream.close()
+    return "".join(parts)
+
 # === GENERATE HUMAN ANSWER ===
-def generate_human_answer(question: str, sql: str, rows: list) -> str:
+SUMMARY_ROWS = 10
+SUMMARY_MAX_BYTES = 2048
+
+def table_to_csv(table: pa.Table, max_rows: int = SUMMARY_ROWS, max_bytes: int = SUMMARY_MAX_BYTES) -> str:
+    """Compact CSV of the first rows, halved until it fits the byte budget"""
+    table = table.slice(0, max_rows)
+    while True:
+        buf = io.BytesIO()
+        pa_csv.write_csv(table, buf)
+        if buf.tell() <= max_bytes or table.num_rows <= 1:
+            return buf.getvalue().decode("utf-8", errors="replace")[:max_bytes]
+        table = table.slice(0, table.num_rows // 2)
+
+async def generate_human_answer(question: str, sql: str, table: pa.Table) -> str:
     """
     Use LLM to generate a natural, conversational answer from query results
     """
-    if len(rows) == 0:
+    if table.num_rows == 0:
         return (
             "I couldn't find any data matching your question. "
             "This could mean the data doesn't exist in our database, "
@@ -64,47 +209,315 @@ def generate_human_answer(question: str, sql: str, rows: list) -> str:
             "Try rephrasing your question or being more specific about the location, crop, or time period."
         )
     
-    # Prepare data summary for LLM
-    data_summary = str(rows) if len(rows) <= 10 else f"First 10 rows: {str(rows[:10])}... (Total {len(rows)} rows)"
-    
-    # Create prompt for natural answer generation
-    answer_prompt = f"""You are a helpful agricultural data analyst. A user asked you a question about agricultural data, and you've retrieved the relevant information from the database.
+    # CSV costs far fewer tokens than a repr() of row dicts
+    csv_text = table_to_csv(table)
 
-User's Question: {question}
+    # Simple summaries go to the fast model; comparisons stay on the 70B one
+    if is_complex_query(question):
+        answer_model, max_tokens = SQL_MODEL, 300
+    else:
+        answer_model, max_tokens = ANSWER_MODEL, 180
 
-Data Retrieved:
-{data_summary}
-
-Your task: Write a natural, conversational answer that:
-1. Directly addresses the user's question
-2. Presents key insights from the data in plain English
-3. Uses a friendly, professional tone (like talking to a farmer or researcher)
-4. Includes specific numbers and facts from the data
-5. Keeps the response concise (2-4 sentences for simple queries, more for complex ones)
-6. If there are trends or patterns, mention them
-7. Avoid technical jargon - explain like you're having a conversation
+    # Same question over the same data gets the same answer
+    answer_key = _cache_key(_question_key(question), sql, csv_text, answer_model)
+    cached = _answer_cache.get(answer_key)
+    if cached is not None:
+        return cached
+    
+    # Create prompt for natural answer generation
+    answer_prompt = f"""You are a friendly agricultural data analyst. Answer the question in 2-4 conversational sentences using specific numbers from the data. No SQL or technical terms.
 
-DO NOT:
-- Say "based on the data" or "according to the database"
-- Mention SQL or technical terms
-- Just list numbers without context
-- Be overly formal or robotic
+Question: {question}
 
-Write a helpful, human answer:"""
+Data ({table.num_rows} rows total):
+{csv_text}
+Answer:"""
 
     try:
-        response = client.chat.completions.create(
-            model=MODEL,
+        response = await client.chat.completions.create(
+            model=answer_model,
             messages=[{"role": "user", "content": answer_prompt}],
             temperature=0.7,
-            max_tokens=300
+            max_tokens=max_tokens
         )
-        return response.choices[0].message.content.strip()
+        answer = response.choices[0].message.content.strip()
+        _answer_cache.set(answer_key, answer, ttl=CACHE_TTL_SECONDS)
+        return answer
     except Exception:
-        return f"I found {len(rows)} result(s) for your question. The data shows various records matching your criteria."
+        return f"I found {table.num_rows} result(s) for your question. The data shows various records matching your criteria."
+
+# === SQL PROMPT ===
+# Keywords that pull a table's schema into the prompt; when nothing matches,
+# every table is included
+TABLE_KEYWORDS = {
+    "crop_production_raw": ["crop", "production", "produce", "yield", "area", "season", "kharif", "rabi", "harvest"],
+    "groundwater_raw": ["groundwater", "ground water", "water level", "well", "aquifer"],
+    "rainfall_raw": ["rain", "monsoon", "precipitation"],
+    "market_price": ["price", "market", "mandi", "commodity", "arrival"],
+    "temperature": ["temperature", "temp", "heat", "climate", "warm"],
+}
+
+# Every keyword in one alternation (longest first) so a question is scanned once
+_KEYWORD_TABLE = {kw: table for table, kws in TABLE_KEYWORDS.items() for kw in kws}
+_TABLE_KW_RE = re.compile("|".join(
+    re.escape(kw) for kw in sorted(_KEYWORD_TABLE, key=len, reverse=True)
+))
+
+def relevant_tables(questions: list) -> list:
+    """Tables whose keywords appear in any of the questions (all tables if none do)"""
+    text = b" ".join(_normalize_question(q) for q in questions).decode()
+    hits = {_KEYWORD_TABLE[m.group()] for m in _TABLE_KW_RE.finditer(text)}
+    tables = [t for t in SCHEMA if t in hits]
+    return tables or list(SCHEMA)
+
+def sql_prompt_header(questions: list) -> str:
+    """Terse instructions + only the schemas the questions need"""
+    schema_desc = "\n".join(SCHEMA_LINES[table] for table in relevant_tables(questions))
+
+    return f"""Write one DuckDB SQL query for the question. Return ONLY the SQL.
+Tables:
+{schema_desc}
+Rules: ILIKE '%x%' for text, = or </> for numbers; double-quote columns with special characters.
+LIMIT 100; ROUND(AVG(x), 2) for averages; order results logically.
+Always filter crop_production_raw on state or crop_year.
+"""
+
+def build_sql_prompt(question: str) -> str:
+    return f"""{sql_prompt_header([question])}
+Question: {question}
+SQL:"""
+
+def build_batch_sql_prompt(questions: list) -> str:
+    numbered = "\n".join(f"{i}: {q}" for i, q in enumerate(questions, 1))
+    return f"""{sql_prompt_header(questions)}
+For each numbered question, output exactly one line 'N: <sql>;' with the whole query on that line.
+Questions:
+{numbered}
+SQL:"""
+
+async def generate_sql(question: str) -> str:
+    """Single-question SQL generation (streamed, stops at the terminating ';')"""
+    stream = await client.chat.completions.create(
+        model=SQL_MODEL,
+        messages=[{"role": "user", "content": build_sql_prompt(question)}],
+        temperature=0.2,
+        max_tokens=500,
+        stream=True,
+        service_tier=SERVICE_TIER or NOT_GIVEN
+    )
+    return await stream_sql(stream)
+
+# === BATCHED SQL GENERATION ===
+_BATCH_LINE_RE = re.compile(r'^\s*(\d+)\s*[:.)]\s*(.+?)\s*$', re.MULTILINE)
+
+def _batch_line_sql(line: str):
+    """The line's SQL if it is one complete, parseable SELECT, else None"""
+    # The prompt asks for 'N: <sql>;' — no ';' means the query wrapped or was cut off
+    if not line.endswith(";"):
+        return None
+    try:
+        harden_sql(clean_sql(line))
+    except (ValueError, sqlglot.errors.SqlglotError):
+        return None
+    return line
+
+class BatchingGroqClient:
+    """
+    Coalesces concurrent SQL-generation requests into one Groq call.
+    Questions arriving within `window` seconds (up to `max_batch`) share a single
+    numbered prompt; a lone question takes the normal single-call path.
+    """
+
+    def __init__(self, max_batch: int = 8, window: float = 0.02):
+        self.max_batch = max_batch
+        self.window = window
+        self._loop = None
+        self._queue = None
+        self._tasks = set()
+
+    async def generate(self, question: str) -> str:
+        loop = asyncio.get_running_loop()
+        if self._loop is not loop:
+            # (Re)start the collector on the current event loop
+            self._loop = loop
+            self._queue = asyncio.Queue()
+            self._spawn(self._collect())
+        future = loop.create_future()
+        await self._queue.put((question, future))
+        return await future
+
+    def _spawn(self, coro) -> None:
+        task = self._loop.create_task(coro)
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _collect(self) -> None:
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = [await self._queue.get()]
+            deadline = loop.time() + self.window
+            while len(batch) < self.max_batch:
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(self._queue.get(), timeout))
+                except asyncio.TimeoutError:
+                    break
+            self._spawn(self._dispatch(batch))
+
+    async def _dispatch(self, batch: list) -> None:
+        if len(batch) == 1:
+            question, future = batch[0]
+            await self._resolve(question, future)
+            return
+
+        try:
+            response = await client.chat.completions.create(
+                model=SQL_MODEL,
+                messages=[{"role": "user", "content": build_batch_sql_prompt([q for q, _ in batch])}],
+                temperature=0.2,
+                max_tokens=300 * len(batch)
+            )
+            lines = {int(n): _batch_line_sql(sql) for n, sql in _BATCH_LINE_RE.findall(response.choices[0].message.content)}
+        except Exception as e:
+            logger.warning(f"Batched SQL generation failed, falling back to single calls: {e}")
+            lines = {}
+
+        # Any question the batch answer missed (or answered with unusable SQL) gets its own call
+        await asyncio.gather(*[
+            self._resolve(question, future, lines.get(i))
+            for i, (question, future) in enumerate(batch, 1)
+        ])
+
+    @staticmethod
+    async def _resolve(question: str, future, sql: str = None) -> None:
+        try:
+            result = sql if sql else await generate_sql(question)
+        except Exception as e:
+            if not future.done():
+                future.set_exception(e)
+            return
+        if not future.done():
+            future.set_result(result)
+
+sql_batcher = BatchingGroqClient()
+
+# === PREPARED STATEMENT CACHE ===
+# Questions that differ only in a year/state/crop share one DuckDB plan: WHERE
+# literals become $n parameters and the statement is PREPAREd once per worker
+# thread (each thread owns a cursor, so no locking), then EXECUTEd with values.
+PLAN_CACHE_SIZE = 256
+_PARAM_PARENTS = (exp.EQ, exp.NEQ, exp.GT, exp.GTE, exp.LT, exp.LTE, exp.Like, exp.ILike, exp.In, exp.Between)
+_plan_local = threading.local()
+
+def parameterize_sql(sql: str) -> tuple:
+    """Swap WHERE-clause comparison literals for $n markers → (template SQL, literal values as SQL)"""
+    tree = sqlglot.parse_one(sql, dialect="duckdb")
+    params = []
+    for where in list(tree.find_all(exp.Where)):
+        for literal in list(where.find_all(exp.Literal)):
+            if isinstance(literal.parent, _PARAM_PARENTS):
+                params.append(literal.sql(dialect="duckdb"))
+                literal.replace(exp.Placeholder(this=str(len(params))))
+    return tree.sql(dialect="duckdb"), params
+
+def _thread_cursor():
+    """This worker thread's cursor and its prepared-statement LRU"""
+    if getattr(_plan_local, "cursor", None) is None:
+        _plan_local.cursor = get_connection()
+        _plan_local.plans = OrderedDict()
+    return _plan_local.cursor, _plan_local.plans
+
+# === EXECUTE SQL ===
+def execute_sql(sql: str):
+    """Run SQL through the prepared-statement cache and return an Arrow table (blocking; call via a thread)"""
+    cur, plans = _thread_cursor()
+    try:
+        template, params = parameterize_sql(sql)
+    except sqlglot.errors.ParseError:
+        return cur.execute(sql).fetch_arrow_table()
+
+    name = plans.get(template)
+    if name is None:
+        name = "q_" + _cache_key(template)
+        try:
+            cur.execute(f"PREPARE {name} AS {template}")
+        except duckdb.Error:
+            # Not preparable as written — run it directly (surfaces the real error if any)
+            return cur.execute(sql).fetch_arrow_table()
+        plans[template] = name
+        if len(plans) > PLAN_CACHE_SIZE:
+            _, evicted = plans.popitem(last=False)
+            cur.execute(f"DEALLOCATE {evicted}")
+    else:
+        plans.move_to_end(template)
+
+    args = f"({', '.join(params)})" if params else ""
+    return cur.execute(f"EXECUTE {name}{args}").fetch_arrow_table()
+
+# === DETERMINISTIC SQL TEMPLATES ===
+# Common question shapes map straight to SQL with no Groq round-trip.
+# Captured groups are letters/spaces only, so they are safe to inline.
+_CROP_METRIC_AGG = {"production": "SUM", "area": "SUM", "yield": "AVG"}
+
+@lru_cache(maxsize=1)
+def _known_crops() -> dict:
+    """Lowercased crop name → its spelling in crop_production_raw (loaded once)"""
+    cursor = get_connection()
+    try:
+        names = cursor.execute(
+            "SELECT DISTINCT crop FROM crop_production_raw WHERE crop IS NOT NULL"
+        ).fetchall()
+    finally:
+        cursor.close()
+    return {" ".join(name.lower().split()): name for (name,) in names}
+
+def _crop_metric_sql(m):
+    crop, metric, state, year = m.group("crop", "metric", "state", "year")
+    # The lazy crop group also swallows modifiers ("total rice"); only an exact
+    # crop name is safe to template, anything else goes to Groq
+    crop = _known_crops().get(" ".join(crop.lower().split()))
+    if crop is None:
+        return None
+    agg = _CROP_METRIC_AGG[metric.lower()]
+    return (
+        f"SELECT state, crop, crop_year, ROUND({agg}({metric.lower()}), 2) AS {metric.lower()} "
+        f"FROM crop_production_raw WHERE crop = '{crop}' AND state ILIKE '%{state.strip()}%' "
+        f"AND crop_year = {year} GROUP BY 1, 2, 3 ORDER BY 1, 2 LIMIT {MAX_ROWS}"
+    )
+
+def _market_price_sql(m) -> str:
+    commodity, state = m.group("commodity", "state")
+    return (
+        f"SELECT state, commodity, ROUND(AVG(modal_price), 2) AS avg_modal_price, "
+        f"ROUND(MIN(min_price), 2) AS min_price, ROUND(MAX(max_price), 2) AS max_price "
+        f"FROM market_price WHERE commodity ILIKE '%{commodity.strip()}%' AND state ILIKE '%{state.strip()}%' "
+        f"GROUP BY 1, 2 ORDER BY 1, 2 LIMIT {MAX_ROWS}"
+    )
+
+_TEMPLATES = [
+    (re.compile(
+        r"(?i)^\s*(?:what\s+is|what's|what\s+was|show(?:\s+me)?)\s+(?:the\s+)?"
+        r"(?P<crop>[a-z][a-z ]*?)\s+(?P<metric>production|yield|area)\s+"
+        r"in\s+(?P<state>[a-z][a-z ]*?)\s+(?:in|for|during)\s+(?P<year>(?:19|20)\d{2})\s*\??\s*$"
+    ), _crop_metric_sql),
+    (re.compile(
+        r"(?i)^\s*(?:what\s+is|what's|show(?:\s+me)?)\s+(?:the\s+)?average\s+(?:market\s+)?price\s+"
+        r"of\s+(?P<commodity>[a-z][a-z ]*?)\s+in\s+(?P<state>[a-z][a-z ]*?)\s*\??\s*$"
+    ), _market_price_sql),
+]
+
+def template_sql(question: str):
+    """SQL for a question matching a known template, else None (blocking; crop names come from the DB)"""
+    for pattern, build in _TEMPLATES:
+        m = pattern.match(question)
+        if m:
+            return build(m)
+    return None
 
 # === MAIN QUERY FUNCTION ===
-def run_intelligent_query(question: str) -> dict:
+async def run_intelligent_query(question: str) -> dict:
     """
     Takes a natural language question and returns:
     {
@@ -113,58 +526,42 @@ def run_intelligent_query(question: str) -> dict:
         "rows": [...] # List of dictionaries
     }
     """
-    schema_desc = "\n".join([f"- {table}: {', '.join(cols)}" for table, cols in SCHEMA.items()])
-    
-    sql_prompt = f"""You are an expert SQL analyst. Convert this question into a valid DuckDB SQL query.
-
-Available tables and columns:
-{schema_desc}
+    try:
+        # Step 1: Generate SQL using Groq (or reuse it for a repeated question)
+        question_key = _question_key(question)
+        cached = _sql_cache.get(question_key)
+        templated = None if cached is not None else await run_in_db_pool(template_sql, question)
+        result_table = None
+        if templated:
+            logger.info(f"Template SQL: {templated}")
+            result_table = await run_in_db_pool(execute_sql, templated)
+            if result_table.num_rows:
+                sql_query = templated
+            else:
+                # An empty template result is more likely a mismatch than missing data
+                logger.info("Template SQL returned no rows; asking Groq instead")
+                result_table = None
 
-IMPORTANT RULES:
-1. Return ONLY the SQL query, no explanation
-2. Use exact column names from the schema (case-sensitive)
-3. For crop_production_raw: Use "State", "District", "Crop", "Crop_Year", "Season", "Area", "Production", "Yield"
-4. For groundwater_raw: Use columns like "State_Name_With_LGD_Code", "District_Name_With_LGD_Code", etc.
-5. For rainfall_raw: Use "District", "Period_Actual(mm)", "Period_Normal(mm)", etc.
-6. For market_prices: Use "State", "District", "Commodity", "Modal_x0020_Price", "Arrival_Date", etc.
-7. For temperature: Use "YEAR", "ANNUAL", "JAN-FEB", "MAR-MAY", "JUN-SEP", "OCT-DEC"
-8. Use ILIKE ONLY for TEXT/VARCHAR columns (e.g., WHERE "Crop" ILIKE '%rice%')
-9. For NUMERIC columns, use = or comparison operators (e.g., WHERE "Crop_Year" = 2020)
-10. Always wrap column names with special characters in double quotes
-11. Limit results to 100 rows maximum using LIMIT 100
-12. For averages, use AVG() and ROUND() to 2 decimal places
-13. Order results logically (e.g., by year DESC, by value DESC)
-
-CRITICAL:
-- Text columns: Use ILIKE for matching
-- Numeric columns: Use = for exact match
-
-User question: {question}
-
-SQL Query:"""
+        if result_table is None:
+            if cached is not None:
+                sql_query = cached
+                logger.info(f"Cached SQL: {sql_query}")
+            else:
+                # Concurrent questions are coalesced into one Groq call
+                sql_query = clean_sql(await sql_batcher.generate(question))
+                logger.info(f"Generated SQL: {sql_query}")
 
-    try:
-        # Step 1: Generate SQL using Groq
-        response = client.chat.completions.create(
-            model=MODEL,
-            messages=[{"role": "user", "content": sql_prompt}],
-            temperature=0.2,
-            max_tokens=500
-        )
-        
-        sql_query = clean_sql(response.choices[0].message.content)
-        logger.info(f"Generated SQL: {sql_query}")
+                if not sql_query or not sql_query.upper().startswith('SELECT'):
+                    raise ValueError(f"Invalid SQL generated: {sql_query}")
+                sql_query = harden_sql(sql_query)
+                _sql_cache.set(question_key, sql_query, ttl=CACHE_TTL_SECONDS)
 
-        if not sql_query or not sql_query.upper().startswith('SELECT'):
-            raise ValueError(f"Invalid SQL generated: {sql_query}")
-        
-        # Step 2: Execute query
-        con = duckdb.connect(DB_PATH, read_only=True)
-        result_df = con.execute(sql_query).df()
-        con.close()
+            # Step 2: Execute query in a worker thread so the event loop stays free
+            result_table = await run_in_db_pool(execute_sql, sql_query)
         
-        rows = result_df.to_dict('records')
-        answer = generate_human_answer(question, sql_query, rows)
+        # Arrow → Python rows in C; skips the pandas DataFrame round-trip
+        rows = result_table.to_pylist()
+        answer = await generate_human_answer(question, sql_query, result_table)
         
         return {"answer": answer, "sql": sql_query, "rows": rows}
     
@@ -173,6 +570,17 @@ SQL Query:"""
     except Exception as e:
         raise ValueError(f"Query processing error: {str(e)}")
 
+async def run_many(questions: list) -> list:
+    """
+    Answer several questions concurrently. SQL generation for the whole set is
+    in flight at once (and coalesced by the batcher); results come back in
+    submission order, with an exception in place of any failed question.
+    """
+    return await asyncio.gather(
+        *(run_intelligent_query(q) for q in questions),
+        return_exceptions=True
+    )
+
 # === TEST FUNCTION (for debugging) ===
 if __name__ == "__main__":
     print("🧪 Testing qa_core with human-like answers...\n")
@@ -181,13 +589,12 @@ if __name__ == "__main__":
         "Show me rainfall data for Kerala",
         "What's the average market price of onion in Maharashtra?"
     ]
-    for q in test_questions:
+    for q, result in zip(test_questions, asyncio.run(run_many(test_questions))):
         print(f"Q: {q}")
-        try:
-            result = run_intelligent_query(q)
-            print(f"SQL: {result['sql']}")
-            print(f"Rows: {len(result['rows'])}")
-            print(f"Answer: {result['answer']}\n")
-            print("-" * 80 + "\n")
-        except Exception as e:
-            print(f"Error: {e}\n")
+        if isinstance(result, Exception):
+            print(f"Error: {result}\n")
+            continue
+        print(f"SQL: {result['sql']}")
+        print(f"Rows: {len(result['rows'])}")
+        print(f"Answer: {result['answer']}\n")
+        print("-" * 80 + "\n")
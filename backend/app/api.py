@@ -4,15 +4,25 @@ AgriClimate Intelligent Q&A API Wrapper
 ⚡ Safely exposes your existing query engine via FastAPI
 """
 
-from fastapi import FastAPI, HTTPException
+from contextlib import asynccontextmanager
+from fastapi import FastAPI, HTTPException, Request
 from pydantic import BaseModel
 from backend.app.intelligent_qa_system_groq import run_intelligent_query
+from backend.app.database_connection import get_shared_connection, close_shared_connection
+
+# Open DuckDB once at startup; requests only take cursors from it
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    app.state.duck = get_shared_connection()
+    yield
+    close_shared_connection()
 
 # Initialize FastAPI
 app = FastAPI(
     title="AgriClimate Intelligent Q&A System",
     description="Query and analyze agricultural datasets intelligently using Groq + DuckDB",
-    version="1.0.0"
+    version="1.0.0",
+    lifespan=lifespan
 )
 
 # Request body schema
@@ -26,15 +36,16 @@ def home():
 
 # Core query endpoint
 @app.post("/query")
-def query_endpoint(req: QueryRequest):
+async def query_endpoint(req: QueryRequest, request: Request):
     """
     Accepts a natural-language question and returns:
       - Human-readable answer
       - SQL query (or steps for complex)
       - Result rows
     """
+    cursor = request.app.state.duck.cursor()
     try:
-        result = run_intelligent_query(req.question)
+        result = await run_intelligent_query(req.question, conn=cursor)
         return {
             "status": "success",
             "question": req.question,
@@ -44,3 +55,5 @@ def query_endpoint(req: QueryRequest):
         }
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
+    finally:
+        cursor.close()
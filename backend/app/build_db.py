@@ -0,0 +1,16 @@
+#!/usr/bin/env python3
+"""
+One-shot DuckDB build step
+Loads the processed CSVs into the database file. Run once per deploy:
+    python -m backend.app.build_db
+"""
+import os
+import sys
+
+# ✅ Same import setup as main.py (backend modules import each other by name)
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+from db_utils import initialize_database
+
+
+if __name__ == "__main__":
+    initialize_database()
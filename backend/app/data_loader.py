@@ -14,12 +14,15 @@ import os
 import re
 import textwrap
 import logging
+import weakref
 from pathlib import Path
 
 import duckdb
 import pandas as pd
 from dotenv import load_dotenv
-from groq import Groq
+from groq import NOT_GIVEN
+
+from groq_client import client
 
 # -------- CONFIG --------
 BASE = Path(__file__).resolve().parents[2]  # /Users/manusd/Crop
@@ -41,36 +44,33 @@ PREFERRED_MODELS = [
     "mixtral-8x7b",
 ]
 
+# Optional Groq service tier (e.g. "performance" for lowest TTFT); unset → account default
+SERVICE_TIER = os.getenv("GROQ_SERVICE_TIER")
+
 # -------- LOGGING & ENV --------
 logging.basicConfig(level=logging.INFO, format="%(levelname)s: %(message)s")
-load_dotenv()  # load GROQ_API_KEY from .env
-GROQ_API_KEY = os.getenv("GROQ_API_KEY")
-if not GROQ_API_KEY:
-    raise RuntimeError("GROQ_API_KEY not set in .env — please add it and re-run.")
-
-client = Groq(api_key=GROQ_API_KEY)
+load_dotenv()  # GROQ_API_KEY is checked by groq_client, which owns the shared client
 
 
 # -------- UTIL: DB loader --------
 def load_processed_into_duckdb(db_path=DB_PATH, processed_dir=PROCESSED_DIR, files=LOAD_FILES):
     """Load processed CSVs into the DuckDB file (CREATE OR REPLACE TABLE)."""
-    conn = duckdb.connect(db_path)
-    logging.info(f"Loading normalized CSVs from {processed_dir} into DuckDB at {db_path} ...")
-    for fname in files:
-        fpath = processed_dir / fname
-        if not fpath.exists():
-            logging.warning(f"File missing: {fpath} — skipping.")
-            continue
-        table_name = fpath.stem.lower()
-        # use read_csv_auto for robust parsing
-        sql = f"""
-            CREATE OR REPLACE TABLE {table_name} AS
-            SELECT * FROM read_csv_auto('{fpath.as_posix()}', header=True);
-        """
-        conn.execute(sql)
-        cnt = conn.execute(f"SELECT COUNT(*) FROM {table_name}").fetchone()[0]
-        logging.info(f" - Loaded {table_name} ({cnt:,} rows)")
-    conn.close()
+    with duckdb.connect(db_path) as conn:
+        logging.info(f"Loading normalized CSVs from {processed_dir} into DuckDB at {db_path} ...")
+        for fname in files:
+            fpath = processed_dir / fname
+            if not fpath.exists():
+                logging.warning(f"File missing: {fpath} — skipping.")
+                continue
+            table_name = fpath.stem.lower()
+            # use read_csv_auto for robust parsing
+            sql = f"""
+                CREATE OR REPLACE TABLE {table_name} AS
+                SELECT * FROM read_csv_auto('{fpath.as_posix()}', header=True);
+            """
+            conn.execute(sql)
+            cnt = conn.execute(f"SELECT COUNT(*) FROM {table_name}").fetchone()[0]
+            logging.info(f" - Loaded {table_name} ({cnt:,} rows)")
     logging.info("All processed CSVs loaded.")
 
 
@@ -79,8 +79,23 @@ def get_conn():
     return duckdb.connect(DB_PATH)
 
 
+# Catalog lookups per connection: the schema doesn't change while a session is open,
+# so SHOW TABLES / PRAGMA table_info run once instead of on every question
+_CATALOG_CACHE = weakref.WeakKeyDictionary()
+
+
+def _catalog(conn):
+    cached = _CATALOG_CACHE.get(conn)
+    if cached is None:
+        cached = _CATALOG_CACHE[conn] = {}
+    return cached
+
+
 def get_tables(conn):
-    return [r[0] for r in conn.execute("SHOW TABLES").fetchall()]
+    cache = _catalog(conn)
+    if "tables" not in cache:
+        cache["tables"] = [r[0] for r in conn.execute("SHOW TABLES").fetchall()]
+    return cache["tables"]
 
 
 def get_table_columns(conn, table):
@@ -88,11 +103,14 @@ def get_table_columns(conn, table):
 
 
 def get_schema_description(conn):
-    desc = []
-    for t in get_tables(conn):
-        cols = get_table_columns(conn, t)
-        desc.append(f"Table: {t}\n  Columns: {', '.join(cols)}")
-    return "\n\n".join(desc)
+    cache = _catalog(conn)
+    if "schema" not in cache:
+        desc = []
+        for t in get_tables(conn):
+            cols = get_table_columns(conn, t)
+            desc.append(f"Table: {t}\n  Columns: {', '.join(cols)}")
+        cache["schema"] = "\n\n".join(desc)
+    return cache["schema"]
 
 
 # -------- UTIL: SQL extraction and safety --------
@@ -122,6 +140,24 @@ def safe_validate_tables_and_cols(conn, sql: str):
             raise ValueError(f"Referenced table '{t_clean}' not found. Available: {available}")
 
 
+def stream_sql(stream) -> str:
+    """Collect a streamed completion, stopping at the first ';' that ends the SQL."""
+    parts = []
+    try:
+        for chunk in stream:
+            if not chunk.choices:
+                continue
+            delta = chunk.choices[0].delta.content or ""
+            if ";" in delta:
+                parts.append(delta[:delta.index(";") + 1])
+                break
+            parts.append(delta)
+    finally:
+        # stop the generation as soon as the statement is complete
+        stream.close()
+    return "".join(parts)
+
+
 # -------- UTIL: model call helpers --------
 def choose_model():
     """Try preferred list; return the first available model id (best-effort)."""
@@ -144,12 +180,14 @@ def generate_sql_via_groq(question: str, schema_text: str, model_id=None):
 
     prompt = f"Schema:\n{schema_text}\n\nQuestion:\n{question}\n\nReturn only the SQL."
 
-    resp = client.chat.completions.create(
+    stream = client.chat.completions.create(
         model=model_id,
         messages=[{"role": "system", "content": system}, {"role": "user", "content": prompt}],
         temperature=0.0,
+        stream=True,
+        service_tier=SERVICE_TIER or NOT_GIVEN,
     )
-    raw = resp.choices[0].message.content.strip()
+    raw = stream_sql(stream).strip()
     sql = extract_sql_block(raw)
     return sql
 
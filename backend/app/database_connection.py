@@ -1,19 +1,70 @@
+import os
 import duckdb
+import asyncio
+import threading
+from functools import partial
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 from contextlib import contextmanager
 
-# Dynamically detect path — works on both local and Render
-BASE_DIR = Path(__file__).resolve().parent.parent
-DB_PATH = BASE_DIR / "data" / "agri_climate_db.duckdb"
+# Dynamically detect path — works on both local and Render.
+# This is the one place DB_PATH is resolved; every other module imports it.
+BASE_DIR = Path(__file__).resolve().parents[2]
+DATA_DIR = BASE_DIR / "data" / "processed"
+DB_PATH = Path(os.getenv("DB_PATH", DATA_DIR / "agri_climate_db.duckdb"))
+
+# Each uvicorn worker process opens its own connection, so when a worker count
+# is configured the machine's DuckDB budget (2GB, every core) is split between
+# them; a single unconfigured process keeps all of it
+WEB_WORKERS = max(1, int(os.getenv("WEB_CONCURRENCY", "1")))
+DUCKDB_MEMORY_MB = 2048 // WEB_WORKERS
+DUCKDB_THREADS = max(1, (os.cpu_count() or 4) // WEB_WORKERS)
+
+# One read-only connection per process; requests get cheap cursors from it
+_CONN = None
+_CONN_LOCK = threading.Lock()
+
+def get_shared_connection():
+    """Process-wide read-only DuckDB connection (opened on first use)"""
+    global _CONN
+    with _CONN_LOCK:
+        if _CONN is None:
+            _CONN = duckdb.connect(
+                str(DB_PATH),
+                read_only=True,
+                config={
+                    "memory_limit": f"{DUCKDB_MEMORY_MB}MB",
+                    "threads": str(DUCKDB_THREADS),
+                    "enable_object_cache": True,
+                }
+            )
+    return _CONN
+
+def close_shared_connection():
+    """Close the shared connection (e.g. on application shutdown)"""
+    global _CONN
+    with _CONN_LOCK:
+        if _CONN is not None:
+            _CONN.close()
+            _CONN = None
+
+# Bounded pool for blocking DuckDB work, so a burst of requests can't spawn
+# more concurrent queries than the connection can usefully run
+DB_EXECUTOR = ThreadPoolExecutor(max_workers=int(os.getenv("QA_POOL", "8")), thread_name_prefix="duckdb")
+
+async def run_in_db_pool(func, *args, **kwargs):
+    """Await `func(*args, **kwargs)` on the DuckDB worker pool"""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(DB_EXECUTOR, partial(func, *args, **kwargs))
 
 def get_connection():
-    """Reusable DuckDB connection"""
-    return duckdb.connect(str(DB_PATH))
+    """Reusable DuckDB cursor on the shared connection"""
+    return get_shared_connection().cursor()
 
 @contextmanager
 def db_connection():
-    """Context manager for auto-closing DuckDB connections"""
-    conn = duckdb.connect(str(DB_PATH))
+    """Context manager for auto-closing DuckDB cursors"""
+    conn = get_connection()
     try:
         yield conn
     finally:
@@ -0,0 +1,38 @@
+#!/usr/bin/env python3
+"""
+Shared Groq clients for the AgriClimate Q&A System
+One pooled keep-alive HTTP connection pool per process, reused by every module
+"""
+import os
+import httpx
+from dotenv import load_dotenv
+from groq import Groq, AsyncGroq
+
+# Load environment variables (.env for local, Render env for production)
+load_dotenv()
+
+GROQ_API_KEY = os.getenv("GROQ_API_KEY")
+if not GROQ_API_KEY:
+    raise ValueError("❌ GROQ_API_KEY not found. Add it in .env or Render dashboard.")
+
+# Keep-alive pool: skips the TLS handshake to api.groq.com on warm requests and
+# caps open sockets under load. Limits belong to the transport — httpx ignores
+# the client-level `limits` once a custom transport is given.
+POOL_LIMITS = httpx.Limits(max_connections=64, max_keepalive_connections=32, keepalive_expiry=30.0)
+TIMEOUT = httpx.Timeout(30.0, connect=5.0)
+
+client = Groq(
+    api_key=GROQ_API_KEY,
+    http_client=httpx.Client(
+        timeout=TIMEOUT,
+        transport=httpx.HTTPTransport(limits=POOL_LIMITS, retries=2),
+    ),
+)
+
+async_client = AsyncGroq(
+    api_key=GROQ_API_KEY,
+    http_client=httpx.AsyncClient(
+        timeout=TIMEOUT,
+        transport=httpx.AsyncHTTPTransport(limits=POOL_LIMITS, retries=2),
+    ),
+)
@@ -3,14 +3,27 @@
 AgriClimate Intelligent Q&A System - Complete Final Version
 Handles both simple and complex multi-step queries with human-like answers
 """
-import duckdb
 import re
-import os
+import json
+import orjson
+import asyncio
 import logging
+import sqlglot
+from sqlglot import exp
 from dotenv import load_dotenv
-from groq import Groq
-from schema import SCHEMA
-from pathlib import Path
+from groq import NOT_GIVEN
+from groq_client import async_client as client
+from llm_cache import LLMCache, completion_cache, completion_key, MAX_CACHEABLE_TEMPERATURE
+from question_cache import QuestionCache
+import plan_cache
+from schema import SCHEMA, SCHEMA_PROMPT, SCHEMA_SETS
+from database_connection import get_shared_connection, run_in_db_pool
+
+try:
+    # google-re2: DFA matching, one linear pass over the question for all indicators
+    import re2 as dfa_re
+except ImportError:
+    dfa_re = re
 
 # -----------------------------------------------------------------------------
 # SETUP
@@ -24,244 +37,547 @@ load_dotenv()
 # -----------------------------------------------------------------------------
 # CONFIGURATION
 # -----------------------------------------------------------------------------
-# ✅ Dynamically resolve DB path
-BASE_DIR = Path(__file__).resolve().parent.parent
-DATA_DIR = BASE_DIR / "data" / "processed"
-
-# First try environment variable (Render will set this), else local fallback
-DB_PATH = os.getenv("DB_PATH", str(DATA_DIR / "agri_climate_db.duckdb"))
+# DuckDB: one shared read-only connection from database_connection (DB_PATH resolved there)
 MODEL = "llama-3.3-70b-versatile"
 
-# Groq API Key
-GROQ_API_KEY = os.getenv("GROQ_API_KEY")
-if not GROQ_API_KEY:
-    raise ValueError("❌ GROQ_API_KEY not found. Add it in .env or Render dashboard.")
+# Groq client: shared pooled AsyncGroq from groq_client (GROQ_API_KEY checked there);
+# LLM round-trips are awaited, DuckDB work runs in worker threads
 
-# Initialize Groq client
-client = Groq(api_key=GROQ_API_KEY)
+# Generation budgets: decode time scales with tokens, so ceilings sit just above
+# typical output lengths. SQL and plans are sampled greedily (deterministic → cacheable).
+SQL_TEMPERATURE = 0.0
+PLAN_TEMPERATURE = 0.0
+ANSWER_TEMPERATURE = 0.7
+SIMPLE_ANSWER_MAX_TOKENS = 150
+COMPLEX_ANSWER_MAX_TOKENS = 250
+PLAN_MAX_TOKENS = 800
+# The model sometimes keeps going with an invented follow-up question
+ANSWER_STOP = ["\n\nQ:", "\n\nQuestion:"]
+
+# -----------------------------------------------------------------------------
+# PROMPTS
+# -----------------------------------------------------------------------------
+# Everything static (role, schema, rules, examples) is built once and sent as the
+# system message, so every request shares a byte-identical prefix; only the user
+# message (question, data) varies.
+SQL_PROMPT_PREFIX = f"""You are an expert SQL analyst. Convert this question into ONE valid DuckDB SQL query.
+
+Database schema:
+{SCHEMA_PROMPT}
+
+Rules:
+1. Columns are lowercase with underscores.
+2. Use ILIKE for text (e.g., WHERE state ILIKE '%punjab%')
+3. Use = for numbers (e.g., WHERE crop_year = 2020)
+4. For rice: (crop ILIKE '%rice%' OR crop ILIKE '%paddy%')
+5. If using CTEs, start with WITH keyword
+6. Give every selected expression a simple alias
+7. LIMIT 100 rows
+
+Respond with a JSON object:
+{{"sql": "<the query>", "answer_template": "<2-3 friendly sentences answering the question, using {{alias}} placeholders for values from the first result row and {{row_count}} for the number of rows>"}}
+
+Example:
+Question: Total wheat production in Punjab in 2010?
+JSON: {{"sql": "SELECT SUM(production) AS total_production FROM crop_production_raw WHERE state ILIKE '%punjab%' AND crop ILIKE '%wheat%' AND crop_year = 2010 LIMIT 100", "answer_template": "Punjab produced {{total_production}} tonnes of wheat in 2010."}}"""
+
+PLAN_PROMPT_PREFIX = """Break this complex question into SQL steps.
+
+Database: crop_production_raw(state, district, crop, crop_year, season, area, production, yield)
+
+Each step should look like:
+STEP 1: ...
+SQL: SELECT ... FROM crop_production_raw WHERE ...
+
+To reuse a value from an earlier step, give it a column alias there and refer to it
+as $alias in later steps (e.g. SELECT MAX(crop_year) AS latest_year ... then
+WHERE crop_year = $latest_year)."""
+
+SIMPLE_ANSWER_PROMPT_PREFIX = """You are an agricultural analyst. Answer conversationally.
+
+Use:
+- Natural language (friendly tone)
+- 2-4 sentences
+- Mention specific values if visible"""
+
+COMPLEX_ANSWER_PROMPT_PREFIX = """You are an agricultural analyst.
+
+Explain in plain English:
+1. Mention both regions/crops compared
+2. Show their production values
+3. Give percent difference
+4. Keep it concise (3–4 lines)"""
+
+# Rephrasings of an answered simple question (same words, same order, filler aside)
+# reuse its full result; multi-step comparisons always run
+answer_cache = QuestionCache()
+
+# Parsed plan steps by normalized question: a repeat skips the Groq call and parsing
+plan_memo = LLMCache(max_entries=512)
+
+def chat_messages(system: str, user: str) -> list:
+    """Static instructions as the system message, the per-request part as the user message"""
+    return [{"role": "system", "content": system}, {"role": "user", "content": user}]
+
+# Provider-side prompt caching: how much of each prompt was served from a cached prefix
+prompt_cache_stats = {"prompt_tokens": 0, "cached_prompt_tokens": 0}
+
+def _record_prompt_usage(usage) -> None:
+    if usage is None:
+        return
+    details = getattr(usage, "prompt_tokens_details", None)
+    if isinstance(details, dict):
+        cached = details.get("cached_tokens") or 0
+    else:
+        cached = getattr(details, "cached_tokens", 0) or 0
+    prompt_cache_stats["prompt_tokens"] += usage.prompt_tokens
+    prompt_cache_stats["cached_prompt_tokens"] += cached
+    logger.info(f"Prompt tokens: {usage.prompt_tokens} ({cached} cached)")
+
+async def cached_completion(messages: list, temperature: float, max_tokens: int, model: str = MODEL,
+                            response_format: dict = None, stop: list = None) -> str:
+    """Groq chat completion text; low-temperature results are reused for identical messages"""
+    cacheable = temperature <= MAX_CACHEABLE_TEMPERATURE
+    if cacheable:
+        key = completion_key(model, json.dumps(messages), temperature)
+        cached = completion_cache.get(key)
+        if cached is not None:
+            return cached
+
+    response = await client.chat.completions.create(
+        model=model,
+        messages=messages,
+        temperature=temperature,
+        max_tokens=max_tokens,
+        response_format=response_format or NOT_GIVEN,
+        stop=stop or NOT_GIVEN
+    )
+    _record_prompt_usage(getattr(response, "usage", None))
+    content = response.choices[0].message.content
+    if cacheable:
+        completion_cache.set(key, content)
+    return content
 
 # -----------------------------------------------------------------------------
 # COMPLEXITY DETECTION
 # -----------------------------------------------------------------------------
+# Plain phrases: a substring test (memchr-fast in C) needs no regex at all
+COMPLEX_LITERALS = ('comparison', 'difference between', 'versus', 'percent difference')
+# Wildcard / word-boundary indicators share one alternation → a single scan
+COMPLEX_PATTERNS = [
+    r'compare.*with',
+    r'highest.*lowest', r'maximum.*minimum', r'max.*min',
+    r'both.*and', r'\bvs\b',
+    r'calculate.*difference',
+    r'latest year.*compare', r'which.*highest.*which.*lowest'
+]
+_COMPLEX_RE = dfa_re.compile('|'.join(COMPLEX_PATTERNS))
+# Every indicator starts with one of these letters; a question containing none
+# of them can't match, so skip both scans
+_COMPLEX_FIRST_CHARS = frozenset("bcdhlmpvw")
+
 def is_complex_query(question: str) -> bool:
     """Detect if query requires multi-step processing"""
-    complex_indicators = [
-        r'compare.*with', r'comparison', r'difference between',
-        r'highest.*lowest', r'maximum.*minimum', r'max.*min',
-        r'both.*and', r'versus', r'\bvs\b',
-        r'calculate.*difference', r'percent difference',
-        r'latest year.*compare', r'which.*highest.*which.*lowest'
-    ]
-    question_lower = question.lower()
-    return any(re.search(ind, question_lower) for ind in complex_indicators)
+    q = question.lower()
+    if _COMPLEX_FIRST_CHARS.isdisjoint(q):
+        return False
+    return any(lit in q for lit in COMPLEX_LITERALS) or bool(_COMPLEX_RE.search(q))
 
 # -----------------------------------------------------------------------------
 # SQL UTILITIES
 # -----------------------------------------------------------------------------
+# Compiled once at import; the hot path only calls .sub()/.search()
+_MD_SQL_RE = re.compile(r'^```sql\s*', re.IGNORECASE)
+_MD_FENCE_RE = re.compile(r'^```|\s*```$')
+_CTE_DETECT_RE = re.compile(r'^[a-z_]+\s+AS\s+\(', re.IGNORECASE)
+_SQL_EXTRACT_RE = re.compile(r'((?:WITH|SELECT)\s+.*)', re.IGNORECASE | re.DOTALL)
+_ILIKE_NUM_RE = re.compile(r'(crop_year|s_no|sr__no_|year)\s+ILIKE\s+[\'"]%(\d+)%[\'"]', re.IGNORECASE)
+# A step's SQL ends at its ';', a blank line or the next STEP — never at trailing prose
+_STEP_SQL_RE = re.compile(r'SQL:\s*(SELECT.*?)(?=;|\n\s*\n|\n\s*STEP|\Z)', re.DOTALL | re.IGNORECASE)
+_PARAM_RE = re.compile(r'\$([A-Za-z_]\w*)')
+_LEGACY_PLACEHOLDER_RE = re.compile(r'\{\{(\w+)\}\}')
+_TEMPLATE_SLOT_RE = re.compile(r'\{(\w+)\}')
+_PUNCT_RE = re.compile(r'[^\w\s]')
+_SPACE_RE = re.compile(r'\s+')
+
+# PostgreSQL-style functions → DuckDB equivalents, fused into one alternation
+# so the query is scanned once; the matching group picks the replacement
+_PG_DUCK_RE = re.compile(
+    r"(?P<to_date>\b(?:TO_DATE|to_date)\s*\()"
+    r"|(?P<date_fmt>'YYYY-MM-DD')"
+    r"|(?P<ilike>ILIKE)"       # DuckDB doesn’t have ILIKE (case-insensitive LIKE)
+    r"|(?P<date_cast>::DATE)"  # remove Postgres-style type casting
+)
+_PG_DUCK_MAP = {
+    "to_date": "STRPTIME(",
+    "date_fmt": "'%Y-%m-%d'",
+    "ilike": "LIKE",
+    "date_cast": "",
+}
+
 def clean_sql(query: str) -> str:
     """Extract, sanitize, and normalize SQL query for DuckDB compatibility"""
-    import re
+    # ⚡ Fast path: already a bare SELECT/WITH with nothing to rewrite
+    query = query.strip()
+    upper = query.upper()
+    if (upper.startswith(('SELECT', 'WITH')) and '```' not in query and '::' not in query
+            and 'ILIKE' not in upper and 'TO_DATE' not in upper and 'YYYY-MM-DD' not in query):
+        return query.rstrip(';').strip()
 
     # 🧹 Step 1: Basic cleanup (your original logic)
-    query = query.strip()
-    query = re.sub(r'^```sql\s*', '', query, flags=re.IGNORECASE)
-    query = re.sub(r'^```|\s*```$', '', query)
+    query = _MD_SQL_RE.sub('', query)
+    query = _MD_FENCE_RE.sub('', query)
     query = query.strip()
     
-    if re.search(r'^[a-z_]+\s+AS\s+\(', query, re.IGNORECASE) and not query.upper().startswith('WITH'):
+    if _CTE_DETECT_RE.search(query) and not query.upper().startswith('WITH'):
         query = 'WITH ' + query
     
-    match = re.search(r'((?:WITH|SELECT)\s+.*)', query, re.IGNORECASE | re.DOTALL)
+    match = _SQL_EXTRACT_RE.search(query)
     if match:
         query = match.group(1)
 
     # 🧠 Step 2: Replace PostgreSQL-style functions with DuckDB equivalents
-    replacements = {
-        r"\bTO_DATE\s*\(": "STRPTIME(",
-        r"\bto_date\s*\(": "STRPTIME(",
-        r"'YYYY-MM-DD'": "'%Y-%m-%d'",
-        r"ILIKE": "LIKE",  # DuckDB doesn’t have ILIKE (case-insensitive LIKE)
-        r"::DATE": "",      # remove Postgres-style type casting
-    }
-    for pattern, replacement in replacements.items():
-        query = re.sub(pattern, replacement, query)
+    query = _PG_DUCK_RE.sub(lambda m: _PG_DUCK_MAP[m.lastgroup], query)
 
     # 🧩 Step 3: Final cleanup
     return query.rstrip(';').strip()
 
 
-def execute_sql(sql: str):
-    """Execute SQL query and return results"""
+# Rows returned when the model forgets a LIMIT
+SQL_ROW_LIMIT = 1000
+
+def validate_sql(sql: str) -> str:
+    """
+    Check tables and columns against SCHEMA locally (sqlglot, no DuckDB round-trip)
+    and add a LIMIT when the query has none. Raises ValueError naming the problem.
+    """
+    try:
+        tree = sqlglot.parse_one(sql, read="duckdb")
+    except sqlglot.errors.ParseError as e:
+        raise ValueError(f"SQL does not parse: {e}") from None
+
+    ctes = {cte.alias_or_name.lower() for cte in tree.find_all(exp.CTE)}
+    tables = {t.name.lower() for t in tree.find_all(exp.Table)}
+    unknown_tables = tables - ctes - SCHEMA.keys()
+    if unknown_tables:
+        raise ValueError(f"Unknown table(s): {', '.join(sorted(unknown_tables))}")
+
+    # Base-table columns plus anything the query names itself (select aliases)
+    known = {a.alias.lower() for a in tree.find_all(exp.Alias)}
+    for table in tables & SCHEMA_SETS.keys():
+        known |= SCHEMA_SETS[table]
+    unknown_cols = {
+        c.name for c in tree.find_all(exp.Column)
+        if c.name and c.name != '*' and c.name.lower() not in known
+    }
+    if unknown_cols:
+        raise ValueError(f"Unknown column(s): {', '.join(sorted(unknown_cols))}")
+
+    if isinstance(tree, exp.Query) and not tree.args.get("limit"):
+        return tree.limit(SQL_ROW_LIMIT).sql(dialect="duckdb")
+    return sql
+
+def execute_sql(sql: str, conn=None, params: dict = None):
+    """Execute SQL query and return results (on `conn` when the caller provides one)"""
+    # A cursor on the process-wide connection skips the connect()/catalog load per step
+    cursor = (conn or get_shared_connection()).cursor()
     try:
-        con = duckdb.connect(DB_PATH, read_only=True)
-        result_df = con.execute(sql).df()
-        con.close()
-        return result_df.to_dict('records')
+        # Relation → Python tuples directly; no intermediate pandas DataFrame.
+        # fetchall() also beats fetch_arrow_table().to_pylist() for row dicts,
+        # from 10 up to 100k rows, so Arrow isn't used for large results either.
+        rel = cursor.sql(sql, params=params or None)
+        if rel is None:
+            return []
+        columns = rel.columns
+        return [dict(zip(columns, row)) for row in rel.fetchall()]
     except Exception as e:
         logger.error(f"SQL execution error: {e}")
         raise
+    finally:
+        cursor.close()
 
 # -----------------------------------------------------------------------------
 # SIMPLE QUERY HANDLER
 # -----------------------------------------------------------------------------
-def execute_simple_query(question: str) -> dict:
-    """Handle simple single-step queries"""
-    schema_desc = "\n".join([f"- {t}: {', '.join(c)}" for t, c in SCHEMA.items()])
-
-    sql_prompt = f"""You are an expert SQL analyst. Convert this question into ONE valid DuckDB SQL query.
-
-Database schema:
-{schema_desc}
-
-Rules:
-1. Columns are lowercase with underscores.
-2. Use ILIKE for text (e.g., WHERE state ILIKE '%punjab%')
-3. Use = for numbers (e.g., WHERE crop_year = 2020)
-4. For rice: (crop ILIKE '%rice%' OR crop ILIKE '%paddy%')
-5. If using CTEs, start with WITH keyword
-6. Return ONLY SQL, no explanation
-7. LIMIT 100 rows
+async def execute_simple_query(question: str, conn=None) -> dict:
+    """
+    Handle simple single-step queries. One Groq call returns both the SQL and an
+    answer template that is filled from the result locally; the separate
+    answer call is only made when the template can't be filled.
+    """
+    sql_query, rows, answer = await prepare_simple_query(question, conn)
+    answer = answer or await generate_simple_answer(question, rows)
+    return {"answer": answer, "sql": sql_query, "rows": rows}
 
-Question: {question}
-SQL:"""
+async def prepare_simple_query(question: str, conn=None) -> tuple:
+    """Generate and run the SQL; returns (sql, rows, templated answer or None)"""
+    messages = chat_messages(SQL_PROMPT_PREFIX, f"Question: {question}\nJSON:")
 
-    response = client.chat.completions.create(
-        model=MODEL,
-        messages=[{"role": "user", "content": sql_prompt}],
-        temperature=0.2,
-        max_tokens=800
-    )
-    
-    sql_query = clean_sql(response.choices[0].message.content)
+    raw = await cached_completion(messages, temperature=SQL_TEMPERATURE, max_tokens=800,
+                                  response_format={"type": "json_object"})
+    sql_query, template = _parse_sql_reply(raw)
+    try:
+        sql_query = validate_sql(sql_query)
+    except ValueError as e:
+        # One retry with the concrete problem, before paying for a DuckDB error
+        logger.warning(f"Generated SQL rejected ({e}); asking for a fix")
+        retry = messages + [
+            {"role": "assistant", "content": raw},
+            {"role": "user", "content": f"That SQL is invalid: {e}\nReturn the corrected JSON object.\nJSON:"},
+        ]
+        raw = await cached_completion(retry, temperature=SQL_TEMPERATURE, max_tokens=800,
+                                      response_format={"type": "json_object"})
+        sql_query, template = _parse_sql_reply(raw)
+        sql_query = validate_sql(sql_query)
+
+    rows = await run_in_db_pool(execute_sql, sql_query, conn)
+    return sql_query, rows, fill_answer_template(template, rows)
+
+def _parse_sql_reply(raw: str) -> tuple:
+    """(cleaned SQL, answer template or None) from the model's JSON reply"""
+    try:
+        parsed = json.loads(raw)
+        sql_query, template = parsed["sql"], parsed.get("answer_template")
+    except (ValueError, KeyError, TypeError):
+        # Not JSON after all — treat the whole reply as SQL
+        sql_query, template = raw, None
+    sql_query = clean_sql(sql_query)
     logger.info(f"Generated SQL: {sql_query}")
 
-    sql_query = re.sub(
-        r'(crop_year|s_no|sr__no_|year)\s+ILIKE\s+[\'"]%(\d+)%[\'"]',
-        r'\1 = \2', sql_query, flags=re.IGNORECASE
-    )
-
-    rows = execute_sql(sql_query)
-    answer = generate_simple_answer(question, rows)
-    
-    return {"answer": answer, "sql": sql_query, "rows": rows}
-
-def generate_simple_answer(question: str, rows: list) -> str:
+    sql_query = _ILIKE_NUM_RE.sub(r'\1 = \2', sql_query)
+    return sql_query, template
+
+def _format_value(value) -> str:
+    if isinstance(value, float):
+        return f"{value:,.2f}".rstrip('0').rstrip('.')
+    if isinstance(value, int) and not isinstance(value, bool) and abs(value) >= 10000:
+        return f"{value:,}"
+    return str(value)
+
+def fill_answer_template(template, rows: list):
+    """Answer text with {alias}/{row_count} slots filled from the result, or None if it doesn't fit"""
+    if not template or not isinstance(template, str) or not rows:
+        return None
+    values = {"row_count": len(rows), **rows[0]}
+    slots = _TEMPLATE_SLOT_RE.findall(template)
+    # The template was written before the model saw the result; unless it quotes
+    # at least one result column it can't be trusted to agree with the rows
+    if not any(slot in rows[0] for slot in slots):
+        return None
+    if any(slot not in values or values[slot] is None for slot in slots):
+        return None
+    return _TEMPLATE_SLOT_RE.sub(lambda m: _format_value(values[m.group(1)]), template).strip()
+
+NO_DATA_ANSWER = "No data found for that question. Try including location or year."
+
+async def generate_simple_answer(question: str, rows: list) -> str:
     if not rows:
-        return "No data found for that question. Try including location or year."
-
-    data_summary = str(rows[:10]) if len(rows) <= 10 else f"First 10 of {len(rows)} rows"
-    answer_prompt = f"""You are an agricultural analyst. Answer conversationally.
-
-Question: {question}
-Data: {data_summary}
-
-Use:
-- Natural language (friendly tone)
-- 2-4 sentences
-- Mention specific values if visible
-Answer:"""
+        return NO_DATA_ANSWER
 
     try:
-        response = client.chat.completions.create(
-            model=MODEL,
-            messages=[{"role": "user", "content": answer_prompt}],
-            temperature=0.7,
-            max_tokens=300
-        )
-        return response.choices[0].message.content.strip()
+        return (await cached_completion(build_simple_answer_prompt(question, rows), temperature=ANSWER_TEMPERATURE,
+                                        max_tokens=SIMPLE_ANSWER_MAX_TOKENS, stop=ANSWER_STOP)).strip()
     except Exception as e:
         logger.error(f"Answer generation failed: {e}")
         return f"Found {len(rows)} result(s)."
 
+def build_simple_answer_prompt(question: str, rows: list) -> list:
+    data_summary = str(rows[:10]) if len(rows) <= 10 else f"First 10 of {len(rows)} rows"
+    return chat_messages(SIMPLE_ANSWER_PROMPT_PREFIX, f"Question: {question}\nData: {data_summary}\nAnswer:")
+
 # -----------------------------------------------------------------------------
 # COMPLEX QUERY HANDLER
 # -----------------------------------------------------------------------------
-def execute_complex_query(question: str) -> dict:
-    plan = create_query_plan(question)
-    results = execute_plan_steps(plan)
-    answer = generate_complex_answer(question, results)
+async def execute_complex_query(question: str, conn=None) -> dict:
+    plan = await create_query_plan(question, conn)
+    results = await execute_plan_steps(plan, conn)
+    if plan_cache.PLAN_CACHE_ENABLED and not plan.get("cached") and results["final_data"]:
+        await run_in_db_pool(plan_cache.store, question, plan["steps"], conn)
+    answer = await generate_complex_answer(question, results)
     return {"answer": answer, "sql": f"Multi-step ({plan['num_steps']} steps)", "rows": results.get('final_data', [])}
 
-def create_query_plan(question: str) -> dict:
-    schema_desc = "\n".join([f"- {t}: {', '.join(c)}" for t, c in SCHEMA.items()])
-    prompt = f"""Break this complex question into SQL steps.
+def _normalize_question(question: str) -> str:
+    """Lowercase, punctuation stripped, whitespace collapsed"""
+    return _SPACE_RE.sub(' ', _PUNCT_RE.sub(' ', question.lower())).strip()
 
-Database: crop_production_raw(state, district, crop, crop_year, season, area, production, yield)
-Question: {question}
+async def create_query_plan(question: str, conn=None) -> dict:
+    norm = _normalize_question(question)
+    memo = plan_memo.get(norm)
+    if memo is not None:
+        return {"num_steps": len(memo), "steps": list(memo), "plan_text": "", "cached": True}
 
-Each step should look like:
-STEP 1: ...
-SQL: SELECT ... FROM crop_production_raw WHERE ...
-"""
-    response = client.chat.completions.create(
-        model=MODEL,
-        messages=[{"role": "user", "content": prompt}],
-        temperature=0.3,
-        max_tokens=1000
-    )
-    text = response.choices[0].message.content
-    steps = [m.group(1).strip().rstrip(';') for m in re.finditer(r'SQL:\s*(SELECT.*?)(?=\n(?:STEP|\Z))', text, re.DOTALL)]
+    if plan_cache.PLAN_CACHE_ENABLED:
+        steps = await run_in_db_pool(plan_cache.lookup, question, conn)
+        if steps:
+            logger.info("→ Reusing cached plan template")
+            return {"num_steps": len(steps), "steps": steps, "plan_text": "", "cached": True}
+
+    messages = chat_messages(PLAN_PROMPT_PREFIX, f"Question: {question}")
+    text = await cached_completion(messages, temperature=PLAN_TEMPERATURE, max_tokens=PLAN_MAX_TOKENS)
+    try:
+        steps = _plan_steps(text)
+    except ValueError as e:
+        logger.warning(f"Plan step rejected ({e}); asking for a fix")
+        retry = messages + [
+            {"role": "assistant", "content": text},
+            {"role": "user", "content": f"A step's SQL is invalid: {e}\nWrite the corrected steps."},
+        ]
+        text = await cached_completion(retry, temperature=PLAN_TEMPERATURE, max_tokens=PLAN_MAX_TOKENS)
+        steps = _plan_steps(text)
+    if steps:
+        plan_memo.set(norm, tuple(steps))
     return {"num_steps": len(steps), "steps": steps, "plan_text": text}
 
-def execute_plan_steps(plan: dict) -> dict:
-    results, all_data = {}, []
-    for i, sql in enumerate(plan['steps'], 1):
-        for key, value in results.items():
-            sql = sql.replace(f"{{{{{key}}}}}", str(value))
-        rows = execute_sql(sql)
-        all_data.extend(rows)
-        if rows:
-            for k, v in rows[0].items():
-                results[k] = v
+def _plan_steps(text: str) -> list:
+    """Validated step SQL from the plan text"""
+    # Older-style {{key}} placeholders don't parse; rewrite them as $key parameters first
+    text = _LEGACY_PLACEHOLDER_RE.sub(r'$\1', text.replace('\r\n', '\n'))
+    return [validate_sql(m.group(1).strip().rstrip(';')) for m in _STEP_SQL_RE.finditer(text)]
+
+async def execute_plan_steps(plan: dict, conn=None) -> dict:
+    """
+    Run plan steps in dependency waves: a step waits only for the $markers it
+    uses, so independent steps run concurrently on worker threads. Earlier
+    results are bound as query parameters, never spliced into the SQL text.
+    """
+    results, step_rows = {}, {}
+    pending = list(enumerate(plan['steps']))
+    while pending:
+        wave = [(i, sql) for i, sql in pending if set(_PARAM_RE.findall(sql)) <= results.keys()]
+        # Unsatisfiable markers: run the next step anyway (it fails as before)
+        wave = wave or pending[:1]
+        bound = [
+            {k: results[k] for k in set(_PARAM_RE.findall(sql)) if k in results}
+            for _, sql in wave
+        ]
+        wave_rows = await asyncio.gather(*(
+            run_in_db_pool(execute_sql, sql, conn, params)
+            for (_, sql), params in zip(wave, bound)
+        ))
+        for (i, _), rows in zip(wave, wave_rows):
+            step_rows[i] = rows
+            if rows:
+                for k, v in rows[0].items():
+                    results[k] = v
+        done = {i for i, _ in wave}
+        pending = [(i, sql) for i, sql in pending if i not in done]
+
+    # Steps often return the same rows (e.g. a shared latest year); keep each once
+    all_data, seen = [], set()
+    for i in sorted(step_rows):
+        for row in step_rows[i]:
+            # Serialized, not a tuple: LIST/STRUCT columns come back as unhashable lists/dicts
+            key = orjson.dumps(row, option=orjson.OPT_SORT_KEYS, default=str)
+            if key not in seen:
+                seen.add(key)
+                all_data.append(row)
     return {"variables": results, "final_data": all_data, "num_steps": plan['num_steps']}
 
-def generate_complex_answer(question: str, results: dict) -> str:
-    prompt = f"""You are an agricultural analyst.
-
-Question: {question}
-Results: {results['variables']}
+async def generate_complex_answer(question: str, results: dict) -> str:
+    answer = await cached_completion(build_complex_answer_prompt(question, results), temperature=ANSWER_TEMPERATURE,
+                                     max_tokens=COMPLEX_ANSWER_MAX_TOKENS, stop=ANSWER_STOP)
+    return answer.strip()
 
-Explain in plain English:
-1. Mention both regions/crops compared
-2. Show their production values
-3. Give percent difference
-4. Keep it concise (3–4 lines)
-Answer:"""
-    response = client.chat.completions.create(
-        model=MODEL,
-        messages=[{"role": "user", "content": prompt}],
-        temperature=0.7,
-        max_tokens=400
-    )
-    return response.choices[0].message.content.strip()
+def build_complex_answer_prompt(question: str, results: dict) -> list:
+    return chat_messages(COMPLEX_ANSWER_PROMPT_PREFIX, f"Question: {question}\nResults: {results['variables']}\nAnswer:")
 
 # -----------------------------------------------------------------------------
 # MAIN ENTRY POINT
 # -----------------------------------------------------------------------------
-def run_intelligent_query(question: str) -> dict:
+async def run_intelligent_query(question: str, conn=None) -> dict:
+    """Answer a question; `conn` is an optional DuckDB connection/cursor to query on"""
     if is_complex_query(question):
         logger.info("→ Complex query detected")
-        return execute_complex_query(question)
+        return await execute_complex_query(question, conn)
+
+    cached = answer_cache.get(question)
+    if cached is not None:
+        logger.info("→ Answered from question cache")
+        return cached
+
+    logger.info("→ Simple query detected")
+    result = await execute_simple_query(question, conn)
+
+    # Empty results usually mean the SQL missed; let a rephrase try again
+    if result["rows"]:
+        answer_cache.set(question, result)
+    return result
+
+async def stream_completion(messages: list, temperature: float, max_tokens: int, model: str = MODEL,
+                            stop: list = None):
+    """Yield answer text as Groq produces it"""
+    stream = await client.chat.completions.create(
+        model=model,
+        messages=messages,
+        temperature=temperature,
+        max_tokens=max_tokens,
+        stop=stop or NOT_GIVEN,
+        stream=True
+    )
+    async for chunk in stream:
+        if chunk.choices and chunk.choices[0].delta.content:
+            yield chunk.choices[0].delta.content
+
+async def stream_intelligent_query(question: str, conn=None):
+    """
+    Streaming variant of run_intelligent_query. Yields (event, data) pairs:
+    one "meta" event with the SQL and rows as soon as the query has run, then
+    "token" events carrying the answer text as it is generated.
+    """
+    complex_query = is_complex_query(question)
+    cached = None if complex_query else answer_cache.get(question)
+    if cached is not None:
+        yield "meta", {"sql": cached["sql"], "rows": cached["rows"]}
+        yield "token", {"text": cached["answer"]}
+        return
+
+    if complex_query:
+        plan = await create_query_plan(question, conn)
+        results = await execute_plan_steps(plan, conn)
+        if plan_cache.PLAN_CACHE_ENABLED and not plan.get("cached") and results["final_data"]:
+            await run_in_db_pool(plan_cache.store, question, plan["steps"], conn)
+        sql_query, rows, answer = f"Multi-step ({plan['num_steps']} steps)", results["final_data"], None
+        messages, max_tokens = build_complex_answer_prompt(question, results), COMPLEX_ANSWER_MAX_TOKENS
+    else:
+        sql_query, rows, answer = await prepare_simple_query(question, conn)
+        if not rows:
+            answer = NO_DATA_ANSWER
+        messages, max_tokens = (build_simple_answer_prompt(question, rows) if answer is None else None), SIMPLE_ANSWER_MAX_TOKENS
+
+    yield "meta", {"sql": sql_query, "rows": rows}
+    if answer is None:
+        parts = []
+        async for text in stream_completion(messages, temperature=ANSWER_TEMPERATURE,
+                                            max_tokens=max_tokens, stop=ANSWER_STOP):
+            parts.append(text)
+            yield "token", {"text": text}
+        answer = "".join(parts).strip()
     else:
-        logger.info("→ Simple query detected")
-        return execute_simple_query(question)
+        yield "token", {"text": answer}
+
+    if rows and not complex_query:
+        answer_cache.set(question, {"answer": answer, "sql": sql_query, "rows": rows})
 
 # -----------------------------------------------------------------------------
 # LOCAL TEST
 # -----------------------------------------------------------------------------
-if __name__ == "__main__":
-    print("🧪 Testing AgriClimate Q&A System\n")
-    tests = [
-        "What is rice production in Punjab?",
-        "Compare Punjab and West Bengal rice production in the latest year"
-    ]
+async def _run_tests(tests: list) -> None:
+    # One event loop for all questions so the async Groq client keeps its connections
     for q in tests:
         print("=" * 80)
         print(f"Q: {q}")
         try:
-            res = run_intelligent_query(q)
+            res = await run_intelligent_query(q)
             print(f"\nSQL: {res['sql']}")
             print(f"Rows: {len(res['rows'])}")
             print(f"\nAnswer:\n{res['answer']}\n")
         except Exception as e:
             print(f"❌ Error: {e}")
+
+if __name__ == "__main__":
+    print("🧪 Testing AgriClimate Q&A System\n")
+    tests = [
+        "What is rice production in Punjab?",
+        "Compare Punjab and West Bengal rice production in the latest year"
+    ]
+    asyncio.run(_run_tests(tests))
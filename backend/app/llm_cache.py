@@ -0,0 +1,61 @@
+#!/usr/bin/env python3
+"""
+LLM completion cache for the AgriClimate Q&A System
+Identical (model, prompt, temperature) requests reuse the earlier completion
+instead of paying the Groq round-trip again
+"""
+import json
+import time
+import hashlib
+import threading
+from collections import OrderedDict
+from typing import Optional
+
+# Only near-deterministic generations are worth reusing
+MAX_CACHEABLE_TEMPERATURE = 0.3
+DEFAULT_TTL_SECONDS = 86400
+
+
+class LLMCache:
+    """Thread-safe in-memory LRU with a per-entry TTL and hit/miss counters"""
+
+    def __init__(self, max_entries: int = 2048):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key: str) -> Optional[str]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[1] < time.monotonic():
+                del self._entries[key]
+                entry = None
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    def set(self, key: str, value: str, ttl: float = DEFAULT_TTL_SECONDS) -> None:
+        with self._lock:
+            self._entries[key] = (value, time.monotonic() + ttl)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {"hits": self.hits, "misses": self.misses, "size": len(self._entries)}
+
+
+def completion_key(model: str, prompt: str, temperature: float) -> str:
+    """Content-addressed key for a completion request"""
+    payload = json.dumps({"m": model, "p": prompt, "t": temperature}, sort_keys=True)
+    return hashlib.sha256(payload.encode()).hexdigest()
+
+
+# Process-wide cache shared by every caller
+completion_cache = LLMCache()
@@ -6,16 +6,28 @@ Serves both backend API (FastAPI) and static frontend (HTML, JS, CSS)
 
 import os
 import sys
+import re
+import json
+import hashlib
 import logging
+from contextlib import asynccontextmanager
+from decimal import Decimal
+import orjson
+import pyarrow as pa
 from fastapi import FastAPI, Request, HTTPException
+from fastapi.exceptions import RequestValidationError
+from fastapi.exception_handlers import request_validation_exception_handler
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import JSONResponse, FileResponse
+from fastapi.middleware.gzip import GZipMiddleware
+from fastapi.responses import JSONResponse, FileResponse, ORJSONResponse, Response, StreamingResponse
 from fastapi.staticfiles import StaticFiles
-from pydantic import BaseModel
+from pydantic import BaseModel, ConfigDict, constr
 
 # ✅ Ensure backend imports work in all environments
 sys.path.append(os.path.dirname(os.path.abspath(__file__)))
-from intelligent_qa_system_groq import run_intelligent_query
+from intelligent_qa_system_groq import run_intelligent_query, stream_intelligent_query, answer_cache, prompt_cache_stats
+from llm_cache import LLMCache, completion_cache
+from database_connection import get_shared_connection, close_shared_connection
 
 
 # -------------------- Logging --------------------
@@ -26,35 +38,128 @@ logging.basicConfig(
 logger = logging.getLogger(__name__)
 
 
+# -------------------- JSON Encoding --------------------
+def _orjson_default(obj):
+    """Types DuckDB rows can carry that orjson doesn't encode natively"""
+    if isinstance(obj, Decimal):
+        return float(obj)
+    raise TypeError
+
+
+def dumps(content) -> bytes:
+    return orjson.dumps(
+        content,
+        default=_orjson_default,
+        option=orjson.OPT_NAIVE_UTC | orjson.OPT_SERIALIZE_NUMPY,
+    )
+
+
+class FastJSONResponse(ORJSONResponse):
+    """orjson rendering that also handles DECIMAL columns and numpy values"""
+
+    def render(self, content) -> bytes:
+        return dumps(content)
+
+
+# Results with more rows than this are streamed in chunks instead of one buffer
+STREAM_ROWS_THRESHOLD = 500
+STREAM_CHUNK_ROWS = 256
+
+
+def json_result_response(result: dict):
+    """{answer, sql, rows} as JSON; large row sets go out chunk by chunk"""
+    rows = result["rows"]
+    if len(rows) <= STREAM_ROWS_THRESHOLD:
+        return FastJSONResponse(result)
+
+    async def chunks():
+        yield b'{"answer":' + dumps(result["answer"]) + b',"sql":' + dumps(result["sql"]) + b',"rows":['
+        for start in range(0, len(rows), STREAM_CHUNK_ROWS):
+            batch = b",".join(dumps(row) for row in rows[start:start + STREAM_CHUNK_ROWS])
+            yield (b"," if start else b"") + batch
+        yield b"]}"
+
+    return StreamingResponse(chunks(), media_type="application/json")
+
+
+def _arrow_column(values: list) -> pa.Array:
+    """One result column; mixed Decimal/float numbers widen to float64, other mixes to text"""
+    try:
+        return pa.array(values)
+    except (pa.ArrowInvalid, pa.ArrowTypeError):
+        present = [v for v in values if v is not None]
+        if all(isinstance(v, (int, float, Decimal)) and not isinstance(v, bool) for v in present):
+            return pa.array([None if v is None else float(v) for v in values], type=pa.float64())
+        return pa.array([None if v is None else str(v) for v in values], type=pa.string())
+
+
+def rows_to_arrow(rows: list) -> pa.Table:
+    """
+    Arrow table over the union of every row's columns. Multi-step results give
+    each row its own keys, so the schema can't be taken from the first row.
+    """
+    columns = list(dict.fromkeys(key for row in rows for key in row))
+    return pa.table({name: _arrow_column([row.get(name) for row in rows]) for name in columns})
+
+
+# -------------------- Lifespan --------------------
+# DuckDB is opened once at boot rather than on the first request (no query is
+# run here); every request then runs on its own cursor from app.state.db
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    app.state.db = get_shared_connection()
+    yield
+    close_shared_connection()
+
+
 # -------------------- FastAPI App --------------------
 app = FastAPI(
     title="🌾 AgriClimate Intelligent Q&A System",
     description="Ask natural questions about agricultural data — powered by Groq + DuckDB",
-    version="1.0.0"
+    version="1.0.0",
+    default_response_class=FastJSONResponse,
+    lifespan=lifespan
 )
 
 
 # -------------------- CORS --------------------
+# Local dev servers on any port plus Render hosts, matched by one compiled regex.
+# The frontend sends no cookies, so credentials stay off.
+CORS_ORIGIN_REGEX = r"^(https?://(localhost|127\.0\.0\.1)(:\d+)?|https://([a-z0-9-]+\.)?onrender\.com)$"
+
 app.add_middleware(
     CORSMiddleware,
-    allow_origins=[
-        "*",  # 🔓 Easier for prototyping — restrict later if needed
-        "http://127.0.0.1:5500",
-        "http://localhost:5500",
-        "http://127.0.0.1:3000",
-        "http://localhost:3000",
-        "https://crop-dcdl.onrender.com",  # Render production
-        "https://your-frontend-domain.vercel.app"
-    ],
-    allow_credentials=True,
+    allow_origins=["https://your-frontend-domain.vercel.app"],
+    allow_origin_regex=CORS_ORIGIN_REGEX,
+    allow_credentials=False,
     allow_methods=["*"],
     allow_headers=["*"],
 )
 
 
+# -------------------- Compression --------------------
+# Row-heavy JSON shrinks several-fold; small bodies and SSE streams pass through as-is
+app.add_middleware(GZipMiddleware, minimum_size=1024)
+
+
+# -------------------- Response Cache --------------------
+# Exact repeats (modulo case/whitespace) skip the whole LLM + SQL pipeline on
+# /ask, /ask_arrow and /ask/stream; rephrasings fall through to the question
+# cache inside the Q&A system
+RESPONSE_CACHE_TTL = 900
+response_cache = LLMCache(max_entries=1024)
+_WHITESPACE_RE = re.compile(r"\s+")
+
+
+def response_cache_key(question: str) -> str:
+    return _WHITESPACE_RE.sub(" ", question.strip().lower())
+
+
 # -------------------- Pydantic Models --------------------
 class QuestionRequest(BaseModel):
-    question: str
+    # Checked by pydantic-core while the body is parsed; see question_validation_handler
+    model_config = ConfigDict(extra="forbid")
+    question: constr(strip_whitespace=True, min_length=5, max_length=1000)
 
 
 class QuestionResponse(BaseModel):
@@ -71,29 +176,33 @@ def health_check():
         "message": "🌾 AgriClimate Q&A System is running!",
         "status": "healthy",
         "version": "1.0.0",
+        "response_cache": response_cache.stats(),
+        "llm_cache": completion_cache.stats(),
+        "question_cache": answer_cache.stats(),
+        "groq_prompt_cache": dict(prompt_cache_stats),
         "endpoints": {
             "ask": "/ask (POST)",
+            "ask_stream": "/ask/stream (POST, server-sent events)",
+            "ask_arrow": "/ask_arrow (POST, Arrow IPC stream)",
             "health": "/health (GET)",
             "docs": "/docs (GET)"
         }
     }
 
 
-@app.post("/ask", response_model=QuestionResponse)
-async def ask_endpoint(request: QuestionRequest):
-    """Handles natural language → SQL → response pipeline"""
-    question = request.question.strip()
-
-    if not question:
-        raise HTTPException(status_code=400, detail="Question cannot be empty.")
-    if len(question) < 5:
-        raise HTTPException(status_code=400, detail="Please ask a more complete question.")
-
-    logger.info(f"🧠 Received question: {question}")
+async def answer_question(question: str) -> dict:
+    """{answer, sql, rows} from the response cache or the Q&A pipeline (errors → HTTP)"""
+    key = response_cache_key(question)
+    cached = response_cache.get(key)
+    if cached is not None:
+        logger.info("⚡ Served from response cache.")
+        return cached
 
+    cursor = app.state.db.cursor()
     try:
-        result = run_intelligent_query(question)
+        result = await run_intelligent_query(question, conn=cursor)
         logger.info(f"✅ Query executed successfully ({len(result['rows'])} rows).")
+        response_cache.set(key, result, ttl=RESPONSE_CACHE_TTL)
         return result
 
     except ValueError as ve:
@@ -104,6 +213,81 @@ async def ask_endpoint(request: QuestionRequest):
         logger.error(f"💥 Unexpected error: {e}", exc_info=True)
         raise HTTPException(status_code=500, detail="Internal server error.")
 
+    finally:
+        cursor.close()
+
+
+@app.post("/ask", response_model=QuestionResponse)
+async def ask_endpoint(request: QuestionRequest):
+    """Handles natural language → SQL → response pipeline"""
+    question = request.question
+    logger.info(f"🧠 Received question: {question}")
+
+    result = await answer_question(question)
+    # Returned directly: response_model documents the shape but rows aren't re-validated
+    return json_result_response(result)
+
+
+@app.post("/ask_arrow", response_class=Response)
+async def ask_arrow_endpoint(request: QuestionRequest):
+    """Same pipeline as /ask; rows as an Arrow IPC stream, answer and SQL in the schema metadata"""
+    question = request.question
+    logger.info(f"🧠 Received question (arrow): {question}")
+
+    result = await answer_question(question)
+    table = rows_to_arrow(result["rows"]).replace_schema_metadata(
+        {"answer": result["answer"], "sql": result["sql"]}
+    )
+    sink = pa.BufferOutputStream()
+    with pa.ipc.new_stream(sink, table.schema) as writer:
+        writer.write_table(table)
+    return Response(sink.getvalue().to_pybytes(), media_type="application/vnd.apache.arrow.stream")
+
+
+@app.post("/ask/stream")
+async def ask_stream_endpoint(request: QuestionRequest):
+    """Same pipeline as /ask, streamed as server-sent events (meta → token… → done)"""
+    question = request.question
+    logger.info(f"🧠 Received question (stream): {question}")
+
+    key = response_cache_key(question)
+    cached = response_cache.get(key)
+
+    async def events():
+        if cached is not None:
+            logger.info("⚡ Served from response cache.")
+            yield f"event: meta\ndata: {json.dumps({'sql': cached['sql'], 'rows': cached['rows']}, default=str)}\n\n"
+            yield f"event: token\ndata: {json.dumps({'text': cached['answer']})}\n\n"
+            yield "event: done\ndata: {}\n\n"
+            return
+
+        cursor = app.state.db.cursor()
+        try:
+            meta, parts = None, []
+            async for event, data in stream_intelligent_query(question, conn=cursor):
+                if event == "meta":
+                    meta = data
+                elif event == "token":
+                    parts.append(data["text"])
+                yield f"event: {event}\ndata: {json.dumps(data, default=str)}\n\n"
+            if meta is not None:
+                result = {"answer": "".join(parts).strip(), "sql": meta["sql"], "rows": meta["rows"]}
+                response_cache.set(key, result, ttl=RESPONSE_CACHE_TTL)
+            yield "event: done\ndata: {}\n\n"
+        except Exception as e:
+            # Details (SQL, DuckDB messages) stay in the log; the client gets a generic message
+            logger.error(f"⚠️ Streaming query error: {e}", exc_info=True)
+            detail = "Could not answer that question. Try rephrasing it." if isinstance(e, ValueError) else "Internal server error."
+            yield f"event: error\ndata: {json.dumps({'detail': detail})}\n\n"
+        finally:
+            cursor.close()
+
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
 
 # -------------------- FRONTEND SERVING --------------------
 # Automatically detect frontend directory
@@ -113,26 +297,66 @@ if os.path.exists(FRONTEND_DIR):
     logger.info(f"📂 Serving static files from: {FRONTEND_DIR}")
     app.mount("/static", StaticFiles(directory=FRONTEND_DIR), name="static")
 
+    # The SPA shell is read once; every request is served from memory with an ETag
+    INDEX_PATH = os.path.join(FRONTEND_DIR, "index.html")
+    INDEX_BYTES = None
+    if os.path.exists(INDEX_PATH):
+        with open(INDEX_PATH, "rb") as f:
+            INDEX_BYTES = f.read()
+    INDEX_ETAG = f'"{hashlib.md5(INDEX_BYTES).hexdigest()}"' if INDEX_BYTES is not None else None
+    INDEX_HEADERS = {"ETag": INDEX_ETAG, "Cache-Control": "public, max-age=60"}
+
+    def index_response(request: Request):
+        """index.html from memory, or 304 when the client already has this version"""
+        if INDEX_BYTES is None:
+            logger.warning("⚠️ index.html not found in frontend folder.")
+            return JSONResponse(content={"detail": "Frontend not found"}, status_code=404)
+        if request.headers.get("if-none-match") == INDEX_ETAG:
+            return Response(status_code=304, headers=INDEX_HEADERS)
+        return Response(INDEX_BYTES, media_type="text/html", headers=INDEX_HEADERS)
+
     @app.get("/", include_in_schema=False)
-    async def serve_frontend_root():
+    async def serve_frontend_root(request: Request):
         """Serve index.html for root path"""
-        index_path = os.path.join(FRONTEND_DIR, "index.html")
-        if os.path.exists(index_path):
-            return FileResponse(index_path)
-        logger.warning("⚠️ index.html not found in frontend folder.")
-        return JSONResponse(content={"detail": "Frontend not found"}, status_code=404)
+        return index_response(request)
+
+    # API and docs paths must 404 here rather than fall back to index.html
+    RESERVED_PATHS = frozenset({"health", "ask", "ask_arrow", "docs", "redoc", "openapi.json", "static"})
 
     @app.get("/{path_name}", include_in_schema=False)
-    async def serve_frontend_files(path_name: str):
-        """Catch-all route for frontend navigation"""
+    async def serve_frontend_files(path_name: str, request: Request):
+        """Catch-all route for frontend navigation (registered after every API route)"""
+        if path_name in RESERVED_PATHS:
+            raise HTTPException(status_code=404, detail="Not found")
         file_path = os.path.join(FRONTEND_DIR, path_name)
-        if os.path.exists(file_path):
+        if path_name != "index.html" and os.path.isfile(file_path):
             return FileResponse(file_path)
-        return FileResponse(os.path.join(FRONTEND_DIR, "index.html"))
+        return index_response(request)
 else:
     logger.warning("⚠️ No frontend directory found — only API endpoints will be available.")
 
 
+# -------------------- Validation Errors --------------------
+QUESTION_ERRORS = {
+    "string_too_long": "Question is too long (max 1000 characters).",
+}
+
+
+@app.exception_handler(RequestValidationError)
+async def question_validation_handler(request: Request, exc: RequestValidationError):
+    """Bad `question` values keep the API's 400 + message contract; other schema errors stay 422"""
+    for error in exc.errors():
+        if tuple(error["loc"]) != ("body", "question"):
+            continue
+        if error["type"] == "string_too_short":
+            text = error["input"].strip() if isinstance(error["input"], str) else ""
+            detail = "Please ask a more complete question." if text else "Question cannot be empty."
+            return JSONResponse(status_code=400, content={"detail": detail})
+        if error["type"] in QUESTION_ERRORS:
+            return JSONResponse(status_code=400, content={"detail": QUESTION_ERRORS[error["type"]]})
+    return await request_validation_exception_handler(request, exc)
+
+
 # -------------------- Global Exception Handler --------------------
 @app.exception_handler(Exception)
 async def global_exception_handler(request: Request, exc: Exception):
@@ -151,9 +375,22 @@ if __name__ == "__main__":
     logger.info(f"🚀 Starting AgriClimate Q&A Server ({env})...")
     logger.info("📘 Docs available at: http://localhost:8000/docs")
 
+    # One worker per core unless configured; exported so each spawned worker's
+    # DuckDB connection takes its share of memory and threads
+    workers = int(os.environ.get("WEB_CONCURRENCY", os.cpu_count() or 2))
+    os.environ["WEB_CONCURRENCY"] = str(workers)
+
+    # Import-string form so uvicorn can spawn workers; "auto" loop/http pick
+    # uvloop and httptools when installed (pure-Python fallback on Windows)
     uvicorn.run(
-        app,
+        "main:app",
+        app_dir=os.path.dirname(os.path.abspath(__file__)),
         host="0.0.0.0",
         port=int(os.environ.get("PORT", 8000)),
+        loop="auto",
+        http="auto",
+        workers=workers,
+        limit_concurrency=1000,
+        timeout_keep_alive=30,
         log_level="info"
     )
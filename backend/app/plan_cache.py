@@ -0,0 +1,154 @@
+#!/usr/bin/env python3
+"""
+Plan-template cache for multi-step queries
+A successful plan is stored with its states/crops/years abstracted into slots;
+a later question with the same shape (the same content words in the same
+order, entities aside) reuses it by filling the slots back in, skipping the
+Groq planning call. Enabled with PLAN_CACHE_ENABLED=1.
+"""
+import os
+import re
+import json
+import sqlite3
+import logging
+import threading
+from contextlib import closing
+from pathlib import Path
+
+from database_connection import DATA_DIR, get_shared_connection
+from question_cache import content_key, content_tokens
+
+logger = logging.getLogger(__name__)
+
+PLAN_CACHE_ENABLED = os.getenv("PLAN_CACHE_ENABLED") == "1"
+PLAN_CACHE_PATH = Path(os.getenv("PLAN_CACHE_PATH", DATA_DIR / "plan_cache.sqlite"))
+_YEAR_RE = re.compile(r"\b(?:19|20)\d{2}\b")
+_SLOT_RE = re.compile(r"\{((?:state|crop|year)\d+)\}")
+_STRING_LITERAL_RE = re.compile(r"'((?:[^']|'')*)'")
+
+_lock = threading.Lock()
+_templates = None  # in-memory mirror: {shape key: (template, entity_schema)}
+
+
+# -----------------------------------------------------------------------------
+# ENTITY SLOTS
+# -----------------------------------------------------------------------------
+_entity_patterns = None
+
+
+def _load_entity_patterns(conn=None) -> tuple:
+    """Case-insensitive matchers for every known state and crop (longest names first)"""
+    global _entity_patterns
+    if _entity_patterns is None:
+        con = (conn or get_shared_connection()).cursor()
+        try:
+            patterns = []
+            for kind in ("state", "crop"):
+                names = [r[0] for r in con.execute(
+                    f"SELECT DISTINCT {kind} FROM crop_production_raw WHERE {kind} IS NOT NULL"
+                ).fetchall()]
+                canonical = {n.strip().lower(): n.strip() for n in names if n.strip()}
+                alternation = "|".join(re.escape(n) for n in sorted(canonical, key=len, reverse=True))
+                patterns.append((kind, re.compile(rf"\b(?:{alternation})\b", re.IGNORECASE), canonical))
+            _entity_patterns = tuple(patterns)
+        finally:
+            con.close()
+    return _entity_patterns
+
+
+def extract_entities(question: str, conn=None) -> dict:
+    """Slot name → canonical value, numbered in order of appearance (state1, crop1, year1, ...)"""
+    found = []
+    for kind, pattern, canonical in _load_entity_patterns(conn):
+        found += [(m.start(), kind, canonical[m.group().lower()]) for m in pattern.finditer(question)]
+    found += [(m.start(), "year", m.group()) for m in _YEAR_RE.finditer(question)]
+
+    entities, counts = {}, {}
+    for _, kind, value in sorted(found):
+        if value in entities.values():
+            continue
+        counts[kind] = counts.get(kind, 0) + 1
+        entities[f"{kind}{counts[kind]}"] = value
+    return entities
+
+
+def _abstract(text: str, entities: dict) -> str:
+    """Replace entity literals with their {slot} markers"""
+    for slot, value in sorted(entities.items(), key=lambda kv: len(kv[1]), reverse=True):
+        text = re.sub(rf"\b{re.escape(value)}\b", "{" + slot + "}", text, flags=re.IGNORECASE)
+    return text
+
+
+# -----------------------------------------------------------------------------
+# STORAGE
+# -----------------------------------------------------------------------------
+def _reusable(template: list, shape: str) -> bool:
+    """
+    True when every literal in the template comes from a slot or from the
+    question's own words. A literal the model added (a '%paddy%' for rice, a
+    hard-coded year) would be replayed unchanged for other questions.
+    """
+    allowed = set(shape.split())
+    for step in template:
+        if _YEAR_RE.search(step):
+            return False
+        for literal in _STRING_LITERAL_RE.findall(step):
+            if not set(content_tokens(literal)) <= allowed:
+                return False
+    return True
+
+
+def _connect():
+    conn = sqlite3.connect(PLAN_CACHE_PATH)
+    conn.execute(
+        "CREATE TABLE IF NOT EXISTS plan_templates (shape TEXT PRIMARY KEY, template TEXT, entity_schema TEXT)"
+    )
+    return conn
+
+
+def _load_templates():
+    global _templates
+    if _templates is None:
+        with closing(_connect()) as store_db:
+            rows = store_db.execute("SELECT shape, template, entity_schema FROM plan_templates").fetchall()
+        _templates = {shape: (json.loads(template), json.loads(schema)) for shape, template, schema in rows}
+    return _templates
+
+
+def lookup(question: str, conn=None):
+    """Plan steps instantiated from the template stored for this question shape, or None"""
+    try:
+        entities = extract_entities(question, conn)
+        shape = content_key(_abstract(question, entities))
+        with _lock:
+            entry = _load_templates().get(shape)
+        if entry is not None:
+            steps, schema = entry
+            if sorted(schema) == sorted(entities):
+                return [_SLOT_RE.sub(lambda m: entities[m.group(1)], step) for step in steps]
+    except Exception as e:
+        logger.warning(f"Plan cache lookup failed: {e}")
+    return None
+
+
+def store(question: str, steps: list, conn=None) -> None:
+    """Save the plan for `question` as a slot template (only if it has entities to abstract)"""
+    global _templates
+    try:
+        entities = extract_entities(question, conn)
+        if not entities or not steps:
+            return
+        shape = content_key(_abstract(question, entities))
+        template = [_abstract(step, entities) for step in steps]
+        if not _reusable(template, shape):
+            logger.info("Plan not cached: it has literals the question doesn't supply")
+            return
+        with _lock:
+            with closing(_connect()) as store_db, store_db:
+                store_db.execute(
+                    "INSERT OR REPLACE INTO plan_templates VALUES (?, ?, ?)",
+                    (shape, json.dumps(template), json.dumps(sorted(entities))),
+                )
+            _templates = None  # reload on next lookup
+    except Exception as e:
+        logger.warning(f"Plan cache store failed: {e}")
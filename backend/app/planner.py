@@ -1,31 +1,60 @@
 import pandas as pd
 from pathlib import Path
+from functools import lru_cache
 
 # Path setup
 BASE = Path(__file__).resolve().parents[2]  # goes two levels up from backend/app
 NORMALIZED_DIR = BASE / "normalized"
+HEADER_SUMMARY = NORMALIZED_DIR / "header_summary.csv"
+
+
+@lru_cache(maxsize=1)
+def _read_headers(summary_mtime):
+    """
+    (file name, columns) pairs, parsed once per ETL run: the ETL's header summary
+    when it lists full headers, otherwise the first rows of each CSV.
+    `summary_mtime` is only the cache key — a re-run ETL invalidates it.
+    """
+    if summary_mtime is not None:
+        summary = pd.read_csv(HEADER_SUMMARY)
+        if "normalized_headers" in summary.columns:
+            return tuple(
+                (row.file, tuple(str(row.normalized_headers).split("|")))
+                for row in summary.itertuples()
+            )
+
+    headers = []
+    for file in NORMALIZED_DIR.glob("*.csv"):
+        if file.name == HEADER_SUMMARY.name:
+            continue
+        try:
+            df = pd.read_csv(file, nrows=2)  # read first 2 rows for speed
+            headers.append((file.name, tuple(df.columns)))
+        except Exception as e:
+            print(f"⚠️ Could not read {file.name}: {e}")
+    return tuple(headers)
+
 
 def list_csv_headers():
     if not NORMALIZED_DIR.exists():
         print(f"❌ Directory not found: {NORMALIZED_DIR}")
         return
 
-    csv_files = [f for f in NORMALIZED_DIR.glob("*.csv") if f.name != "header_summary.csv"]
+    summary_mtime = HEADER_SUMMARY.stat().st_mtime if HEADER_SUMMARY.exists() else None
+    headers = _read_headers(summary_mtime)
 
-    if not csv_files:
+    if not headers:
         print("⚠️ No CSV files found in normalized folder.")
         return
 
-    print(f"✅ Found {len(csv_files)} CSV files in {NORMALIZED_DIR}\n")
+    print(f"✅ Found {len(headers)} CSV files in {NORMALIZED_DIR}\n")
 
     summary_lines = []
 
-    for file in csv_files:
-        try:
-            df = pd.read_csv(file, nrows=2)  # read first 2 rows for speed
-            cols = ", ".join(df.columns)
-            print(f"📄 {file.name}")
-            print(f"   → Columns ({len(df.columns)}): {cols}\n")
-            summary_lines.append(f"{file.name}: {cols}")
-        except Exception as e:
-            print
+    for name, columns in headers:
+        cols = ", ".join(columns)
+        print(f"📄 {name}")
+        print(f"   → Columns ({len(columns)}): {cols}\n")
+        summary_lines.append(f"{name}: {cols}")
+
+    return summary_lines
@@ -0,0 +1,51 @@
+#!/usr/bin/env python3
+"""
+Repeat-question cache for the AgriClimate Q&A System
+"Show me the rice production in Punjab, please" and "rice production in punjab"
+share one answer: case, punctuation, articles and politeness filler don't
+matter, but every other word (states, crops, seasons, years, highest/lowest,
+from/to/and/in) must match in order
+"""
+import re
+
+from llm_cache import LLMCache
+
+_TOKEN_RE = re.compile(r"[a-z0-9]+")
+# Only words that never change what is being asked; connectives and range words
+# ("from 2010 to 2015" vs "in 2010 and 2015") stay in the key
+_STOPWORDS = frozenset("""
+    a an the please kindly can could would you me i tell show give
+""".split())
+
+
+def content_tokens(text: str) -> list:
+    """Lowercased words of `text` in order, filler words dropped"""
+    return [t for t in _TOKEN_RE.findall(text.lower()) if t not in _STOPWORDS]
+
+
+def content_key(text: str) -> str:
+    """Normalized question text — two questions with the same key ask the same thing"""
+    return " ".join(content_tokens(text))
+
+
+class QuestionCache:
+    """
+    Bounded exact-match answer store keyed by content_key(). Word order is part
+    of the key: "compare Punjab with Haryana" and "compare Haryana with Punjab"
+    are different questions, as are the same question for kharif and for rabi.
+    """
+
+    def __init__(self, max_entries: int = 1024):
+        self._entries = LLMCache(max_entries=max_entries)
+
+    def get(self, question: str):
+        key = content_key(question)
+        return self._entries.get(key) if key else None
+
+    def set(self, question: str, value) -> None:
+        key = content_key(question)
+        if key:
+            self._entries.set(key, value)
+
+    def stats(self) -> dict:
+        return self._entries.stats()
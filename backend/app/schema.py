@@ -2,8 +2,9 @@
 Database schema for AgriClimate system
 EXACT column names from DuckDB (all lowercase with underscores)
 """
+import sys
 
-SCHEMA = {
+_RAW_SCHEMA = {
     "crop_production_raw": [
         "state", "district", "crop", "crop_year", "season", 
         "area", "production", "yield"
@@ -81,4 +82,14 @@ SCHEMA = {
         "oct_dec", 
         "unnamed:_10"
     ]
-}
\ No newline at end of file
+}
+
+# Immutable, interned column names: names shared across tables (state, district)
+# are one object, and SCHEMA_SETS gives O(1) "col in table" checks
+SCHEMA = {table: tuple(sys.intern(c) for c in cols) for table, cols in _RAW_SCHEMA.items()}
+SCHEMA_SETS = {table: frozenset(cols) for table, cols in SCHEMA.items()}
+
+# Prompt-ready schema text, formatted once at import: one line per table, and
+# the full block every SQL prompt embeds (identical bytes on every request)
+SCHEMA_LINES = {table: f"- {table}: {', '.join(cols)}" for table, cols in SCHEMA.items()}
+SCHEMA_PROMPT = "\n".join(SCHEMA_LINES.values())
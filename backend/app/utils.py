@@ -1,22 +1,27 @@
 import os
+import logging
 from pathlib import Path
+from functools import lru_cache
 from dotenv import load_dotenv
 
+logger = logging.getLogger(__name__)
+
+@lru_cache(maxsize=1)
 def load_env():
-    """Load environment variables from .env at project root."""
+    """Load environment variables from .env at project root (once per process)."""
     base_dir = Path(__file__).resolve().parents[2]
     dotenv_path = base_dir / ".env"
 
     if dotenv_path.exists():
         load_dotenv(dotenv_path)
-        print(f"✅ Loaded .env file from: {dotenv_path}")
+        logger.info(f"✅ Loaded .env file from: {dotenv_path}")
     else:
-        print(f"⚠️ .env file not found at: {dotenv_path}")
+        logger.warning(f"⚠️ .env file not found at: {dotenv_path}")
 
     api_key = os.getenv("GROQ_API_KEY")
     if not api_key:
         raise EnvironmentError("❌ GROQ_API_KEY not found in .env file.")
     else:
-        print("🔑 GROQ_API_KEY successfully loaded!")
+        logger.info("🔑 GROQ_API_KEY successfully loaded!")
 
     return api_key
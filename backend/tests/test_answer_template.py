@@ -0,0 +1,28 @@
+import os
+import sys
+import unittest
+
+os.environ.setdefault("GROQ_API_KEY", "test")
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "app"))
+
+from intelligent_qa_system_groq import fill_answer_template
+
+ROWS = [{"state": "Punjab", "total": 29752339.0}]
+
+
+class FillAnswerTemplateTest(unittest.TestCase):
+    def test_fills_result_columns(self):
+        self.assertEqual(
+            fill_answer_template("{state} produced {total} tonnes.", ROWS),
+            "Punjab produced 29,752,339 tonnes.",
+        )
+
+    def test_template_without_slots_is_rejected(self):
+        self.assertIsNone(fill_answer_template("Punjab produced a record harvest.", ROWS))
+
+    def test_row_count_alone_is_rejected(self):
+        self.assertIsNone(fill_answer_template("Found {row_count} rows.", ROWS))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,23 @@
+import asyncio
+import os
+import sys
+import unittest
+from unittest import mock
+
+os.environ.setdefault("GROQ_API_KEY", "test")
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "app"))
+
+import intelligent_qa_system_groq as qa
+
+
+class ExecutePlanStepsTest(unittest.TestCase):
+    def test_list_columns_are_deduplicated(self):
+        rows = [{"state": "Punjab", "crops": ["Rice", "Wheat"]}]
+        plan = {"steps": ["SELECT 1", "SELECT 2"], "num_steps": 2}
+        with mock.patch.object(qa, "execute_sql", lambda sql, conn=None, params=None: list(rows)):
+            results = asyncio.run(qa.execute_plan_steps(plan))
+        self.assertEqual(results["final_data"], rows)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,33 @@
+import os
+import sys
+import unittest
+
+os.environ.setdefault("GROQ_API_KEY", "test")
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "app"))
+
+from intelligent_qa_system_groq import _plan_steps
+
+
+class PlanStepsTest(unittest.TestCase):
+    def test_trailing_prose_after_last_step(self):
+        text = (
+            "STEP 1: Find the latest year\n"
+            "SQL: SELECT MAX(crop_year) AS latest_year FROM crop_production_raw;\n"
+            "STEP 2: Production in that year\n"
+            "SQL: SELECT state, SUM(production) AS total FROM crop_production_raw\n"
+            "WHERE crop_year = {{latest_year}} GROUP BY state;\n"
+            "\n"
+            "This computes stuff."
+        )
+        steps = _plan_steps(text)
+        self.assertEqual(len(steps), 2)
+        self.assertIn("$latest_year", steps[1])
+        self.assertNotIn("This computes", steps[1])
+
+    def test_prose_after_blank_line_without_semicolon(self):
+        text = "STEP 1: Total\nSQL: SELECT SUM(production) AS total FROM crop_production_raw\n\nDone."
+        self.assertEqual(len(_plan_steps(text)), 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
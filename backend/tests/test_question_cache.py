@@ -0,0 +1,30 @@
+import os
+import sys
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "app"))
+
+from question_cache import QuestionCache, content_key
+
+
+class QuestionCacheTest(unittest.TestCase):
+    def test_filler_words_share_a_key(self):
+        self.assertEqual(
+            content_key("Show me the rice production in Punjab, please"),
+            content_key("rice production in punjab"),
+        )
+
+    def test_range_and_list_questions_differ(self):
+        cache = QuestionCache()
+        cache.set("rice production in punjab from 2010 to 2015", "range")
+        self.assertIsNone(cache.get("rice production in punjab in 2010 and 2015"))
+        self.assertEqual(cache.get("Rice production in Punjab from 2010 to 2015?"), "range")
+
+    def test_word_order_matters(self):
+        cache = QuestionCache()
+        cache.set("Compare rice production of Punjab with West Bengal", "pb-wb")
+        self.assertIsNone(cache.get("Compare rice production of West Bengal with Punjab"))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -1,8 +1,12 @@
 import os
+import re
+import csv
+import codecs
 import logging
 import pandas as pd
 import duckdb
 from pathlib import Path
+from charset_normalizer import from_bytes
 
 # --- Setup ---
 logging.basicConfig(level=logging.INFO, format="%(levelname)s: %(message)s")
@@ -14,6 +18,13 @@ OUT_DIR.mkdir(exist_ok=True)
 DB_PATH = BASE / "agri_climate_duckdb"
 
 ENCODINGS = ["utf-8", "latin1", "windows-1252"]
+_HDR_RE = re.compile(r"[()\-./]")
+# Encodings DuckDB's CSV reader handles without extensions (latin-1 accepts any bytes)
+DUCKDB_ENCODINGS = ["utf-8", "latin-1"]
+# Markers pandas reads as missing by default, so both loaders agree on NULLs
+DUCKDB_NULL_STRINGS = ["", "NA", "N/A", "n/a", "NaN", "nan", "NULL", "null", "#N/A", "None"]
+# Optional cap for the load (e.g. "8GB"); unset leaves DuckDB's default
+ETL_MEMORY_LIMIT = os.getenv("ETL_MEMORY_LIMIT")
 
 FILES = [
     "groundwater_raw.csv",
@@ -25,89 +36,162 @@ FILES = [
 
 
 # --- Helper functions ---
-def try_read_csv(path):
-    """Try multiple encodings until the file reads successfully."""
-    for enc in ENCODINGS:
+def detect_encoding(path):
+    """
+    Best-guess encoding from the first 64 KiB; ASCII reads as UTF-8. Guesses outside
+    ENCODINGS (e.g. cp1250 for a cp1252 file) return None so the usual order applies.
+    """
+    with open(path, "rb") as f:
+        head = f.read(65536)
+    best = from_bytes(head).best()
+    if best is None:
+        return None
+    enc = codecs.lookup(best.encoding).name
+    enc = "utf-8" if enc == "ascii" else enc
+    return enc if enc in {codecs.lookup(e).name for e in ENCODINGS} else None
+
+
+def try_read_csv(path, detected=None):
+    """Read with the detected encoding first, then the usual fallbacks."""
+    candidates = [detected] if detected else []
+    candidates += [enc for enc in ENCODINGS if codecs.lookup(enc).name != detected]
+    for enc in candidates:
         try:
             df = pd.read_csv(path, encoding=enc, low_memory=False)
             logging.info(f"Read {path.name} with encoding {enc}")
             return df, enc
         except UnicodeDecodeError:
             logging.warning(f"Encoding {enc} failed for {path.name}, trying next...")
-    raise UnicodeDecodeError(f"All encodings failed for {path.name}")
+    raise ValueError(f"All encodings failed for {path.name}")
+
+
+def normalize_columns(columns):
+    """Cleaned-up header names (lowercase, separators → underscores)."""
+    return [_HDR_RE.sub("_", str(c).strip().lower().replace(" ", "_")) for c in columns]
 
 
 def normalize_headers(df):
     """Clean up column headers."""
-    df.columns = (
-        df.columns.str.strip()
-        .str.lower()
-        .str.replace(" ", "_")
-        .str.replace(r"[()\-./]", "_", regex=True)
-    )
+    df.columns = normalize_columns(df.columns)
     return df
 
 
 def clean_dataframe(df):
-    """Clean numeric and string columns."""
-    for col in df.columns:
-        if df[col].dtype == "object":
-            df.loc[:, col] = df[col].astype(str).str.strip().replace({"nan": pd.NA})
-        else:
-            try:
-                df.loc[:, col] = pd.to_numeric(df[col], errors="coerce")
-            except Exception:
-                continue
+    """Strip string columns and turn blanks into NA; numeric columns are already parsed."""
+    obj_cols = df.select_dtypes(include="object").columns
+    if len(obj_cols):
+        df[obj_cols] = (
+            df[obj_cols].astype(str)
+            .apply(lambda s: s.str.strip())
+            .replace({"nan": pd.NA, "": pd.NA})
+        )
     return df
 
 
-# --- Main ETL ---
-def main():
-    summary = []
-
-    for file in FILES:
-        path = DATA_DIR / file
-        if not path.exists():
-            logging.warning(f"{file} not found in data/. Skipping.")
-            continue
-
+def _pandas_names(path, enc, names):
+    """DuckDB's column names, with blank header cells named as pandas does ("Unnamed: N")."""
+    with open(path, newline="", encoding=enc) as f:
+        header = next(csv.reader(f), [])
+    if len(header) != len(names):
+        return names
+    return [name if cell.strip() else f"Unnamed: {i}" for i, (cell, name) in enumerate(zip(header, names))]
+
+
+def plan_csv_duckdb(conn, path, detected=None):
+    """
+    Sniff a CSV with DuckDB and build the normalizing SELECT that loads it in one pass
+    (no pandas, no CSV writeback). Returns (encoding, original headers, select SQL);
+    raises duckdb.Error if no encoding works.
+    """
+    # A single-byte legacy encoding in the head means UTF-8 would fail anyway
+    encodings = DUCKDB_ENCODINGS if detected in (None, "utf-8") else DUCKDB_ENCODINGS[::-1]
+    for enc in encodings:
+        source = (
+            f"read_csv('{path}', header=true, sample_size=-1, encoding='{enc}', "
+            f"nullstr={DUCKDB_NULL_STRINGS})"
+        )
         try:
-            df, enc = try_read_csv(path)
-        except Exception as e:
-            logging.error(f"Failed to read {file}: {e}")
+            columns = conn.execute(f"DESCRIBE SELECT * FROM {source}").fetchall()
+        except duckdb.Error as e:
+            logging.warning(f"DuckDB read with {enc} failed for {path.name}: {str(e).splitlines()[0]}")
             continue
 
-        orig_headers = "|".join(df.columns)
-        df = normalize_headers(df)
-        df = clean_dataframe(df)
+        orig_headers = _pandas_names(path, enc, [name for name, *_ in columns])
+        select = []
+        for (name, col_type, *_), new_name in zip(columns, normalize_columns(orig_headers)):
+            col = '"' + name.replace('"', '""') + '"'
+            if col_type == "VARCHAR":
+                # Same cleanup as clean_dataframe: strip, blanks → NULL
+                col = f"NULLIF(TRIM({col}), '')"
+            select.append(f'{col} AS "{new_name}"')
+
+        return enc, orig_headers, f"SELECT {', '.join(select)} FROM {source}"
+    raise duckdb.Error(f"No encoding worked for {path.name}")
 
-        # Save normalized file
-        normalized_path = OUT_DIR / file
-        df.to_csv(normalized_path, index=False)
-        logging.info(f"Processed: {file} → normalized and saved.")
 
-        normalized_sample = "|".join(df.columns[:5])
-        summary.append([file, enc, orig_headers, normalized_sample])
+def read_csv_pandas(path, detected=None):
+    """Fallback reader for files DuckDB's sniffer can't parse. Returns (encoding, original headers, frame)."""
+    df, enc = try_read_csv(path, detected)
+    orig_headers = list(df.columns)
+    return enc, orig_headers, clean_dataframe(normalize_headers(df))
+
+
+# --- Main ETL ---
+def main():
+    # Sniff every file first: a failed probe inside a transaction would abort it
+    with duckdb.connect(DB_PATH) as conn:
+        loads = []
+        for file in FILES:
+            path = DATA_DIR / file
+            if not path.exists():
+                logging.warning(f"{file} not found in data/. Skipping.")
+                continue
+
+            detected = detect_encoding(path)
+            try:
+                enc, orig_headers, source = plan_csv_duckdb(conn, path, detected)
+            except duckdb.Error:
+                logging.warning(f"DuckDB could not read {file}; falling back to pandas.")
+                try:
+                    enc, orig_headers, source = read_csv_pandas(path, detected)
+                except Exception as e:
+                    logging.error(f"Failed to read {file}: {e}")
+                    continue
+            loads.append((file, path.stem, enc, orig_headers, source))
+
+        # Then load everything in one transaction, with DuckDB's full thread pool
+        conn.execute(f"PRAGMA threads={os.cpu_count() or 4}")
+        if ETL_MEMORY_LIMIT:
+            conn.execute(f"PRAGMA memory_limit='{ETL_MEMORY_LIMIT}'")
+        conn.execute("BEGIN TRANSACTION")
+        try:
+            for file, table_name, enc, orig_headers, source in loads:
+                logging.info(f"Loading {table_name} into DuckDB...")
+                if isinstance(source, str):
+                    conn.execute(f"CREATE OR REPLACE TABLE {table_name} AS {source}")
+                else:
+                    conn.register("etl_frame", source)
+                    conn.execute(f"CREATE OR REPLACE TABLE {table_name} AS SELECT * FROM etl_frame")
+                    conn.unregister("etl_frame")
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+
+        summary = []
+        for file, table_name, enc, orig_headers, _ in loads:
+            normalized_headers = [d[0] for d in conn.execute(f"SELECT * FROM {table_name} LIMIT 0").description]
+            logging.info(f"Processed: {file} → normalized and loaded.")
+            summary.append([
+                file, enc, "|".join(orig_headers), "|".join(normalized_headers[:5]), "|".join(normalized_headers)
+            ])
 
     # Write header summary
     pd.DataFrame(
         summary,
-        columns=["file", "encoding", "original_headers", "normalized_sample"]
+        columns=["file", "encoding", "original_headers", "normalized_sample", "normalized_headers"]
     ).to_csv(OUT_DIR / "header_summary.csv", index=False)
 
-    # --- Load into DuckDB ---
-    conn = duckdb.connect(DB_PATH)
-    for csv_file in OUT_DIR.glob("*.csv"):
-        if csv_file.name == "header_summary.csv":
-            continue
-        table_name = csv_file.stem
-        logging.info(f"Loading {table_name} into DuckDB...")
-        conn.execute(f"""
-            CREATE OR REPLACE TABLE {table_name} AS
-            SELECT * FROM read_csv_auto('{csv_file}', header=True);
-        """)
-
-    conn.close()
     logging.info(f"ETL complete. Summary: {OUT_DIR / 'header_summary.csv'}")
     logging.info(f"DuckDB ready at: {DB_PATH}")
 
@@ -9,6 +9,36 @@ const output = document.getElementById("output");
 const API_URL = window.location.origin.includes("onrender.com")
   ? `${window.location.origin}/ask` // e.g., https://crop-dcdl.onrender.com/ask
   : "http://127.0.0.1:8000/ask";    // for local testing
+// ⚡ Streaming variant: answer text appears as it is generated
+const STREAM_URL = `${API_URL}/stream`;
+
+function renderTable(rows) {
+  if (rows && rows.length > 0) {
+    const headers = Object.keys(rows[0]);
+    const tableHTML = `
+      <table>
+        <thead><tr>${headers.map(h => `<th>${h}</th>`).join("")}</tr></thead>
+        <tbody>
+          ${rows.map(r => `<tr>${headers.map(h => `<td>${r[h]}</td>`).join("")}</tr>`).join("")}
+        </tbody>
+      </table>
+    `;
+    tableEl.innerHTML = tableHTML;
+  } else {
+    tableEl.innerHTML = "<p>No data found.</p>";
+  }
+}
+
+// Parse one server-sent event block ("event: x\ndata: {...}")
+function parseEvent(block) {
+  let event = "message";
+  let data = "";
+  for (const line of block.split("\n")) {
+    if (line.startsWith("event:")) event = line.slice(6).trim();
+    else if (line.startsWith("data:")) data += line.slice(5).trim();
+  }
+  return { event, data: data ? JSON.parse(data) : {} };
+}
 
 askBtn.addEventListener("click", async () => {
   const question = questionInput.value.trim();
@@ -23,7 +53,7 @@ askBtn.addEventListener("click", async () => {
   tableEl.innerHTML = "";
 
   try {
-    const res = await fetch(API_URL, {
+    const res = await fetch(STREAM_URL, {
       method: "POST",
       headers: { "Content-Type": "application/json" },
       body: JSON.stringify({ question }),
@@ -40,28 +70,36 @@ askBtn.addEventListener("click", async () => {
       throw new Error(errMsg);
     }
 
-    const data = await res.json();
+    const reader = res.body.getReader();
+    const decoder = new TextDecoder();
+    let buffer = "";
+    let answer = "";
 
-    // ✅ Display response
-    answerEl.textContent = data.answer || "(no summary)";
-    sqlEl.textContent = data.sql || "(no SQL returned)";
+    while (true) {
+      const { value, done } = await reader.read();
+      if (done) break;
+      buffer += decoder.decode(value, { stream: true });
 
-    // ✅ Render table dynamically
-    if (data.rows && data.rows.length > 0) {
-      const headers = Object.keys(data.rows[0]);
-      const tableHTML = `
-        <table>
-          <thead><tr>${headers.map(h => `<th>${h}</th>`).join("")}</tr></thead>
-          <tbody>
-            ${data.rows.map(r => `<tr>${headers.map(h => `<td>${r[h]}</td>`).join("")}</tr>`).join("")}
-          </tbody>
-        </table>
-      `;
-      tableEl.innerHTML = tableHTML;
-    } else {
-      tableEl.innerHTML = "<p>No data found.</p>";
+      let sep;
+      while ((sep = buffer.indexOf("\n\n")) !== -1) {
+        const { event, data } = parseEvent(buffer.slice(0, sep));
+        buffer = buffer.slice(sep + 2);
+
+        if (event === "meta") {
+          // ✅ SQL and table arrive before the answer text
+          sqlEl.textContent = data.sql || "(no SQL returned)";
+          renderTable(data.rows);
+        } else if (event === "token") {
+          answer += data.text;
+          answerEl.textContent = answer;
+        } else if (event === "error") {
+          throw new Error(data.detail || "Query failed.");
+        }
+      }
     }
 
+    if (!answer) answerEl.textContent = "(no summary)";
+
   } catch (err) {
     console.error(err);
     answerEl.textContent = `❌ ${err.message || "Error connecting to backend."}`;